@@ -0,0 +1,138 @@
+from functools import wraps
+from flask import current_app, g, flash, redirect, url_for, has_app_context
+from flask_login import current_user
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+from werkzeug.local import LocalProxy
+from models import db, Account, AccountMember
+from user_cache import MemoryBackend, RedisBackend
+
+OWNER = 'owner'
+ADMIN = 'admin'
+MEMBER = 'member'
+
+
+class MembershipResolver:
+    """Resolve a user's role in every account they can access
+
+    The full {account_id: role} map is loaded with one query and kept on
+    flask.g for the rest of the request. When ACL_CACHE_TTL is set it is also
+    cached across requests in ACL_CACHE_BACKEND and dropped whenever an
+    Account or AccountMember row for the user changes. Only the shared redis
+    backend sees drops made by other workers; the memory backend is for
+    single-process deployments.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = app.config.get('ACL_CACHE_TTL', 0)
+        backend = app.config.get('ACL_CACHE_BACKEND', 'redis')
+        if not ttl:
+            self.backend = None
+        elif backend == 'redis':
+            self.backend = RedisBackend(app.config['ACL_CACHE_REDIS_URL'], ttl=ttl, prefix='acl:')
+        elif backend == 'memory':
+            self.backend = MemoryBackend(max_size=app.config.get('ACL_CACHE_SIZE', 10000), ttl=ttl)
+        else:
+            raise ValueError(f'Unknown ACL_CACHE_BACKEND: {backend}')
+        app.extensions['membership_resolver'] = self
+
+    def roles_for(self, user_id):
+        """Get the {account_id: role} map for a user"""
+        request_cache = g.setdefault('account_roles', {})
+        if user_id in request_cache:
+            return request_cache[user_id]
+
+        roles = self.backend.get(user_id) if self.backend is not None else None
+        if roles is None:
+            roles = self._load(user_id)
+            if self.backend is not None:
+                self.backend.set(user_id, roles)
+        request_cache[user_id] = roles
+        return roles
+
+    def invalidate(self, user_id):
+        """Drop cached roles for a user"""
+        if self.backend is not None:
+            self.backend.delete(user_id)
+        if has_app_context():
+            g.get('account_roles', {}).pop(user_id, None)
+
+    def _load(self, user_id):
+        rows = db.session.query(Account.id, Account.owner_id, AccountMember.is_admin).outerjoin(
+            AccountMember,
+            (AccountMember.account_id == Account.id) & (AccountMember.user_id == user_id)
+        ).filter(
+            or_(Account.owner_id == user_id, AccountMember.user_id == user_id)
+        ).all()
+        roles = {}
+        for account_id, owner_id, is_admin in rows:
+            if owner_id == user_id:
+                roles[account_id] = OWNER
+            elif is_admin:
+                roles[account_id] = ADMIN
+            else:
+                roles[account_id] = MEMBER
+        return roles
+
+
+# The instance create_app made for the current app
+resolver = LocalProxy(lambda: current_app.extensions['membership_resolver'])
+
+
+def get_account_role(account_id, user=None):
+    """Get the current user's role in an account, or None without access"""
+    user = user or current_user
+    return resolver.roles_for(user.id).get(account_id)
+
+
+def account_access_required(view):
+    """Require the current user to belong to the account_id in the URL
+
+    The resolved role is stored on g.account_role for the view.
+    """
+    @wraps(view)
+    def decorated(*args, **kwargs):
+        role = get_account_role(kwargs['account_id'])
+        if role is None:
+            flash('You do not have access to this account.', 'danger')
+            return redirect(url_for('dashboard'))
+        g.account_role = role
+        return view(*args, **kwargs)
+    return decorated
+
+
+@event.listens_for(AccountMember, 'after_insert')
+@event.listens_for(AccountMember, 'after_update')
+@event.listens_for(AccountMember, 'after_delete')
+@event.listens_for(Account, 'after_insert')
+@event.listens_for(Account, 'after_update')
+@event.listens_for(Account, 'after_delete')
+def _mark_roles_changed(mapper, connection, target):
+    """Remember users whose roles changed so their cache entry is dropped on commit"""
+    session = Session.object_session(target)
+    if session is None:
+        return
+    key = 'user_id' if isinstance(target, AccountMember) else 'owner_id'
+    # A reassigned row changes the roles of its previous user as well
+    user_ids = {getattr(target, key), *inspect(target).attrs[key].history.deleted}
+    user_ids.discard(None)
+    session.info.setdefault('changed_role_user_ids', set()).update(user_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_roles(session):
+    user_ids = session.info.pop('changed_role_user_ids', ())
+    current = current_app.extensions.get('membership_resolver') if has_app_context() else None
+    if current is not None:
+        for user_id in user_ids:
+            current.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_roles(session):
+    session.info.pop('changed_role_user_ids', None)
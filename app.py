@@ -1,36 +1,148 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, send_from_directory
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+import importlib
+import os
+import json
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from functools import partial
+import click
+from flask import Flask, Response, abort, current_app, render_template, redirect, url_for, flash, request, g, stream_with_context
+from flask.cli import ScriptInfo, with_appcontext
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import configure_mappers
 from werkzeug.exceptions import RequestEntityTooLarge
-import os
-import uuid
-from config import Config
-from models import db, User, LoginHistory, Account, AccountMember, Invitation
-from forms import RegistrationForm, LoginForm, InvitationForm, ProfileForm
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config import config
+from database import configure_engine, apply_sqlite_pragmas, read_only, replica_reads
+from models import db, User, Account, AccountMember, Invitation
+from services import get_dashboard_data, get_account_members, get_pending_invitations
+from login_writer import LoginEventWriter
+from user_cache import UserCache, user_cache
+from passwords import PasswordHasher
+from images import ImagePipeline, ImageTooLarge, image_pipeline
+from uploads import send_upload
+from instrumentation import RequestProfiler
+from acl import MembershipResolver, account_access_required, get_account_role, OWNER, ADMIN
+from fragments import FragmentCache
+from assets import AssetPipeline, asset_pipeline
+from compression import ResponseCompression
+from jobs import JobQueue, job_queue
+from mail import Mailer
+from ratelimit import AdmissionControl
 
-app = Flask(__name__)
-app.config.from_object(Config)
+# Modules imported on first use by views and commands, loaded up front by preload()
+DEFERRED_MODULES = ('forms', 'invitations', 'registration', 'PIL.Image')
 
-# Initialize extensions
-db.init_app(app)
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
+# (rule, view, options) for every view, registered on each app by create_app
+ROUTES = []
+
+
+def route(rule, **options):
+    """Record a view to be registered by create_app"""
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+
+def create_app(config_name=None):
+    """Create and configure an application instance
+
+    config_name selects a profile from config.py and defaults to APP_CONFIG.
+    Nothing here touches the database schema; run `flask init-db` to create or
+    upgrade it.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config[config_name or os.environ.get('APP_CONFIG') or 'default'])
+    proxies = {name: app.config.get(f'PROXY_FIX_X_{name.upper()}', 0) for name in ('for', 'proto', 'host')}
+    if any(proxies.values()):
+        # Take the client address, scheme and host from the trusted proxies' headers
+        app.wsgi_app = ProxyFix(app.wsgi_app, **{f'x_{name}': count for name, count in proxies.items()})
+
+    # Initialize extensions
+    configure_engine(app)
+    db.init_app(app)
+    apply_sqlite_pragmas(app, db)
+    if _running_flask_cli():
+        # Alembic takes longer to import than the rest of the app, and only
+        # `flask db` and `flask init-db` need it
+        from flask_migrate import Migrate
+        Migrate(app, db, directory=os.path.join(app.root_path, 'migrations'), render_as_batch=True)
+    login_manager.init_app(app)
+    # Each app gets its own extension instances in app.extensions, reached
+    # through the module-level proxies (user_cache, job_queue, ...)
+    AdmissionControl(app)
+    LoginEventWriter(app)
+    UserCache(app)
+    MembershipResolver(app)
+    ImagePipeline(app)
+    PasswordHasher(app)
+    RequestProfiler(app)
+    FragmentCache(app)
+    AssetPipeline(app)
+    ResponseCompression(app)
+    Mailer(app)
+    JobQueue(app)
+
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.register_error_handler(RequestEntityTooLarge, handle_file_too_large)
+    for command in (init_db, build_assets, compact_logins, invite_bulk, provision_users_cmd, jobs_cli, export_cmd):
+        app.cli.add_command(command)
+    return app
+
+
+def preload(app):
+    """Warm an application before a pre-fork server forks its workers
+
+    Imports the deferred modules, compiles every Jinja template and configures
+    the SQLAlchemy mappers once so forked workers share the result, then
+    disposes the engines so no pooled connection is inherited. Each forked
+    child also resets its pools without closing the parent's connections.
+    """
+    for name in DEFERRED_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    configure_mappers()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+    if not app.extensions.get('preloaded'):
+        os.register_at_fork(after_in_child=partial(_reset_pools, app))
+        app.extensions['preloaded'] = True
+
+
+def _reset_pools(app):
+    """Give a forked worker fresh connection pools"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def _running_flask_cli():
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.find_object(ScriptInfo) is not None
+
+
 @login_manager.user_loader
 def load_user(user_id):
     """Load user by ID for Flask-Login"""
-    return User.query.get(int(user_id))
+    return user_cache.load(int(user_id))
+
 
-@app.errorhandler(RequestEntityTooLarge)
 def handle_file_too_large(e):
     """Handle file size limit exceeded"""
     flash('Image Too Large - Maximum file size is 2MB', 'danger')
     return redirect(url_for('profile'))
 
 
-@app.route('/')
+@route('/')
 def index():
     """Home page"""
     if current_user.is_authenticated:
@@ -38,28 +150,18 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     """User registration"""
+    from forms import RegistrationForm
+    from registration import register_user
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
-        user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
-        db.session.add(user)
-        db.session.commit()
-        
-        # Create a default account for the user
-        account = Account(name=f"{user.username}'s Account", owner_id=user.id)
-        db.session.add(account)
-        db.session.commit()
-        
-        # Add user as admin member of their own account
-        member = AccountMember(account_id=account.id, user_id=user.id, is_admin=True)
-        db.session.add(member)
-        db.session.commit()
+        # User, default account and owner membership are committed together
+        register_user(form.username.data, form.email.data, form.password.data)
         
         flash('Registration successful! Please log in.', 'success')
         return redirect(url_for('login'))
@@ -67,9 +169,10 @@ def register():
     return render_template('register.html', form=form)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     """User login"""
+    from forms import LoginForm
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
     
@@ -77,6 +180,10 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
+            # Upgrade the stored hash if the hashing parameters have changed
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user)
             # Record login event
             user.record_login()
@@ -91,7 +198,7 @@ def login():
     return render_template('login.html', form=form)
 
 
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     """User logout"""
@@ -99,10 +206,11 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
-@app.route('/profile', methods=['GET', 'POST'])
+@route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     """User profile editing"""
+    from forms import ProfileForm
     form = ProfileForm()
     
     if form.validate_on_submit():
@@ -115,37 +223,25 @@ def profile():
         current_user.country = form.country.data.strip() or None
         
         # Handle profile image upload
+        old_image = current_user.profile_image
         if form.profile_image.data:
-            file = form.profile_image.data
-            
-            # Check file size manually as additional validation
-            file.seek(0, 2)  # Seek to end of file
-            file_size = file.tell()
-            file.seek(0)  # Reset to beginning
-            
-            if file_size > app.config['MAX_CONTENT_LENGTH']:
+            try:
+                filename = image_pipeline.save_upload(form.profile_image.data)
+            except ImageTooLarge:
                 flash('Image Too Large - Maximum file size is 2MB', 'danger')
                 return redirect(url_for('profile'))
             
-            # Generate unique filename to avoid conflicts
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            
-            # Ensure upload directory exists
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-            
-            # Delete old profile image if it exists
-            if current_user.profile_image:
-                old_image_path = os.path.join(app.config['UPLOAD_FOLDER'], current_user.profile_image)
-                if os.path.exists(old_image_path):
-                    try:
-                        os.remove(old_image_path)
-                    except Exception:
-                        pass  # Ignore errors when deleting old image
-            
-            # Save new image
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
-            current_user.profile_image = unique_filename
+            # Identical images are stored once, so their variants may already exist
+            variants = image_pipeline.existing_variants(filename)
+            current_user.profile_image = filename
+            current_user.profile_image_variants = json.dumps(variants) if variants is not None else None
+            if variants is None:
+                image_pipeline.process(current_user.id, filename)
+        
+        # Queued in the same transaction, so variants are only generated and
+        # the old image only deleted once the new one is committed
+        if old_image and old_image != current_user.profile_image:
+            image_pipeline.discard(old_image)
         
         try:
             db.session.commit()
@@ -153,6 +249,14 @@ def profile():
         except Exception as e:
             db.session.rollback()
             flash('An error occurred while updating your profile. Please try again.', 'danger')
+            return redirect(url_for('profile'))
+        
+        # A discard_image job may have removed the shared file of identical
+        # content before the commit; recorded variants then need regenerating
+        if form.profile_image.data and image_pipeline.restore(form.profile_image.data, filename) and variants is not None:
+            current_user.profile_image_variants = None
+            image_pipeline.process(current_user.id, filename)
+            db.session.commit()
         return redirect(url_for('profile'))
     
     # Pre-populate form with existing data
@@ -166,133 +270,105 @@ def profile():
     
     return render_template('profile.html', form=form)
 
-@app.route('/dashboard')
+@route('/dashboard')
 @login_required
+@read_only(db)
 def dashboard():
     """Dashboard showing login statistics"""
-    # Get recent login count (last 30 days)
-    recent_login_count = current_user.get_recent_login_count(days=30)
-    
-    # Get recent login records
-    recent_logins = current_user.get_recent_logins(limit=10)
-    
-    # Get user's accounts
-    accounts = []
-    # Add owned accounts
-    for account in current_user.owned_accounts:
-        accounts.append({
-            'account': account,
-            'is_owner': True,
-            'is_admin': True
-        })
-    
-    # Add accounts where user is a member
-    for membership in current_user.memberships:
-        if membership.account.owner_id != current_user.id:  # Don't duplicate owned accounts
-            accounts.append({
-                'account': membership.account,
-                'is_owner': False,
-                'is_admin': membership.is_admin
-            })
+    # Login statistics and account list are loaded in a fixed number of queries
+    data = get_dashboard_data(current_user, days=30, limit=10)
     
     return render_template('dashboard.html', 
-                           recent_login_count=recent_login_count,
-                           recent_logins=recent_logins,
-                           accounts=accounts)
+                           recent_login_count=data['recent_login_count'],
+                           recent_logins=data['recent_logins'],
+                           accounts=data['accounts'])
 
-@app.route('/uploads/<filename>')
+@route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_upload(filename)
 
-@app.route('/account/<int:account_id>')
+@route('/account/<int:account_id>')
 @login_required
+@read_only(db)
+@account_access_required
 def view_account(account_id):
     """View account details"""
     account = Account.query.get_or_404(account_id)
     
-    # Check if user has access to this account
-    is_owner = account.owner_id == current_user.id
-    membership = AccountMember.query.filter_by(account_id=account_id, user_id=current_user.id).first()
-    
-    if not is_owner and not membership:
-        flash('You do not have access to this account.', 'danger')
-        return redirect(url_for('dashboard'))
+    is_owner = g.account_role == OWNER
+    is_admin = g.account_role in (OWNER, ADMIN)
     
-    is_admin = is_owner or (membership and membership.is_admin)
+    # Get a page of account members
+    page_size = current_app.config['ACCOUNT_PAGE_SIZE']
+    members, next_members = get_account_members(
+        account_id, cursor=request.args.get('members_after'), limit=page_size)
     
-    # Get account members
-    members = AccountMember.query.filter_by(account_id=account_id).all()
-    
-    # Get pending invitations (only if admin)
-    pending_invitations = []
+    # Get a page of pending invitations (only if admin)
+    pending_invitations, next_invitations = [], None
     if is_admin:
-        pending_invitations = Invitation.query.filter_by(account_id=account_id, status='pending').all()
+        pending_invitations, next_invitations = get_pending_invitations(
+            account_id, cursor=request.args.get('invitations_after'), limit=page_size)
     
     return render_template('account.html', 
                            account=account,
                            is_owner=is_owner,
                            is_admin=is_admin,
                            members=members,
-                           pending_invitations=pending_invitations)
+                           next_members=next_members,
+                           pending_invitations=pending_invitations,
+                           next_invitations=next_invitations)
 
 
-@app.route('/account/<int:account_id>/invite', methods=['GET', 'POST'])
+@route('/account/<int:account_id>/invite', methods=['GET', 'POST'])
 @login_required
+@account_access_required
 def invite_user(account_id):
-    """Invite a user to join an account"""
+    """Invite a user to join an account (any member can invite)"""
+    from forms import InvitationForm
+    from invitations import invite_emails, ALREADY_MEMBER, ALREADY_INVITED
     account = Account.query.get_or_404(account_id)
     
-    # Check if user has access to this account (any member can invite)
-    is_owner = account.owner_id == current_user.id
-    membership = AccountMember.query.filter_by(account_id=account_id, user_id=current_user.id).first()
-    
-    if not is_owner and not membership:
-        flash('You do not have access to this account.', 'danger')
-        return redirect(url_for('dashboard'))
-    
     form = InvitationForm()
     if form.validate_on_submit():
         email = form.email.data
         
-        # Check if user is already a member
-        invited_user = User.query.filter_by(email=email).first()
-        if invited_user:
-            existing_membership = AccountMember.query.filter_by(
-                account_id=account_id, 
-                user_id=invited_user.id
-            ).first()
-            if existing_membership:
-                flash('This user is already a member of the account.', 'warning')
-                return redirect(url_for('view_account', account_id=account_id))
-        
-        # Check if invitation already exists
-        existing_invitation = Invitation.query.filter_by(
-            account_id=account_id,
-            invitee_email=email,
-            status='pending'
-        ).first()
-        if existing_invitation:
+        # Membership and duplicate checks are shared with bulk invitations
+        email, outcome = invite_emails(account_id, current_user.id, [email])[0]
+        if outcome == ALREADY_MEMBER:
+            flash('This user is already a member of the account.', 'warning')
+        elif outcome == ALREADY_INVITED:
             flash('An invitation has already been sent to this email.', 'warning')
-            return redirect(url_for('view_account', account_id=account_id))
-        
-        # Create invitation
-        invitation = Invitation(
-            account_id=account_id,
-            inviter_id=current_user.id,
-            invitee_email=email
-        )
-        db.session.add(invitation)
-        db.session.commit()
-        
-        flash(f'Invitation sent to {email}!', 'success')
+        else:
+            flash(f'Invitation sent to {email}!', 'success')
         return redirect(url_for('view_account', account_id=account_id))
     
     return render_template('invite.html', form=form, account=account)
 
 
-@app.route('/invitations')
+@route('/account/<int:account_id>/invite/bulk', methods=['GET', 'POST'])
+@login_required
+@account_access_required
+def bulk_invite(account_id):
+    """Invite many users to an account from pasted addresses or a CSV file"""
+    from forms import BulkInvitationForm
+    from invitations import parse_emails, invite_emails, INVITED
+    account = Account.query.get_or_404(account_id)
+    
+    form = BulkInvitationForm()
+    results = None
+    if form.validate_on_submit():
+        emails = parse_emails(form.emails.data, form.csv_file.data)
+        results = invite_emails(account_id, current_user.id, emails)
+        sent = sum(1 for _, outcome in results if outcome == INVITED)
+        flash(f'{sent} of {len(results)} invitations sent.', 'success' if sent else 'warning')
+    
+    return render_template('invite_bulk.html', form=form, account=account, results=results)
+
+
+@route('/invitations')
 @login_required
+@read_only(db)
 def view_invitations():
     """View pending invitations for current user"""
     invitations = Invitation.query.filter_by(
@@ -303,7 +379,47 @@ def view_invitations():
     return render_template('invitations.html', invitations=invitations)
 
 
-@app.route('/invitation/<int:invitation_id>/accept')
+@route('/account/<int:account_id>/export/<any(members, invitations):name>.<any(csv, ndjson):fmt>')
+@login_required
+@account_access_required
+def export_account(account_id, name, fmt):
+    """Download an account's member list, or its invitation history for admins"""
+    if name == 'invitations' and g.account_role not in (OWNER, ADMIN):
+        flash('Only account admins can export invitations.', 'danger')
+        return redirect(url_for('view_account', account_id=account_id))
+    return _export_response(name, fmt, account_id=account_id)
+
+
+@route('/export/logins.<any(csv, ndjson):fmt>')
+@login_required
+def export_logins(fmt):
+    """Download the current user's login history"""
+    return _export_response('logins', fmt, user_id=current_user.id)
+
+
+def _export_response(name, fmt, **params):
+    """Stream an export with optional ?since=, ?until= and ?gzip=1"""
+    from exports import FORMATS, generate_export, export_filename, parse_date
+    try:
+        since = parse_date(request.args.get('since'))
+        until = parse_date(request.args.get('until'), end=True)
+    except ValueError as e:
+        abort(400, str(e))
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    
+    def generate():
+        with replica_reads(db.session()):
+            yield from generate_export(name, fmt, compress, since, until, **params)
+    
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/gzip' if compress else FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={export_filename(name, fmt, compress)}'
+    # Let nginx pass rows on as they are produced instead of buffering the export
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@route('/invitation/<int:invitation_id>/accept')
 @login_required
 def accept_invitation(invitation_id):
     """Accept an invitation"""
@@ -319,12 +435,7 @@ def accept_invitation(invitation_id):
         return redirect(url_for('view_invitations'))
     
     # Check if already a member
-    existing_membership = AccountMember.query.filter_by(
-        account_id=invitation.account_id,
-        user_id=current_user.id
-    ).first()
-    
-    if existing_membership:
+    if get_account_role(invitation.account_id) is not None:
         flash('You are already a member of this account.', 'warning')
         invitation.status = 'accepted'
         invitation.responded_at = datetime.utcnow()
@@ -348,7 +459,7 @@ def accept_invitation(invitation_id):
     return redirect(url_for('view_account', account_id=invitation.account_id))
 
 
-@app.route('/invitation/<int:invitation_id>/decline')
+@route('/invitation/<int:invitation_id>/decline')
 @login_required
 def decline_invitation(invitation_id):
     """Decline an invitation"""
@@ -372,16 +483,189 @@ def decline_invitation(invitation_id):
     return redirect(url_for('view_invitations'))
 
 
-@app.cli.command()
-def init_db():
-    """Initialize the database."""
-    db.create_all()
+@click.command('init-db')
+@click.option('--check', is_flag=True, help='Only report whether migrations are pending (exit status 1 if so).')
+@with_appcontext
+def init_db(check):
+    """Create or upgrade the database schema by applying all migrations.
+
+    Run once per deployment before starting the servers; the application
+    itself never changes the schema when it starts.
+    """
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from flask_migrate import upgrade
+    script = ScriptDirectory.from_config(current_app.extensions['migrate'].migrate.get_config())
+    with db.engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+    pending = current != set(script.get_heads())
+    if check:
+        print('Migrations are pending.' if pending else 'Database is up to date.')
+        raise SystemExit(1 if pending else 0)
+    if not pending:
+        print('Database is up to date.')
+        return
+    upgrade()
     print('Database initialized.')
 
 
+@click.command('build-assets')
+@with_appcontext
+def build_assets():
+    """Build fingerprinted, pre-compressed static bundles."""
+    for entry in asset_pipeline.build_all():
+        print(f"Built {entry['file']}")
+
+
+@click.command('compact-logins')
+@click.option('--days', type=int, default=None, help='Keep raw login history for this many days.')
+@click.option('--backfill', is_flag=True, help='Rebuild rollups from raw history without deleting anything.')
+@click.option('--queue', is_flag=True, help='Queue the compaction for the job worker instead of running it here.')
+@with_appcontext
+def compact_logins(days, backfill, queue):
+    """Fold old login history into the daily rollup table."""
+    from login_stats import compact_login_history, rebuild_login_stats
+    if queue:
+        job_queue.enqueue('compact_logins', {'days': days})
+        db.session.commit()
+        print('Queued login history compaction.')
+        return
+    if backfill:
+        rebuilt = rebuild_login_stats()
+        print(f'Rebuilt {rebuilt} daily login rollups.')
+        return
+    if days is None:
+        days = current_app.config['LOGIN_HISTORY_RETENTION_DAYS']
+    deleted = compact_login_history(days=days)
+    print(f'Compacted {deleted} login history rows older than {days} days.')
+
+
+@click.group('jobs')
+def jobs_cli():
+    """Run and inspect background jobs."""
+
+
+@jobs_cli.command('work')
+@click.option('--kinds', default=None, help='Comma-separated job kinds to run (default: all).')
+@click.option('--threads', type=int, default=None, help='Jobs run at once by this worker.')
+@click.option('--once', is_flag=True, help='Exit once no jobs are due instead of polling.')
+@with_appcontext
+def jobs_work(kinds, threads, once):
+    """Run queued jobs until stopped with SIGTERM or Ctrl-C."""
+    import signal
+    for name in current_app.config['JOB_TASK_MODULES']:
+        importlib.import_module(name)
+    kinds = [kind for kind in (kinds or '').split(',') if kind] or None
+    for kind in kinds or ():
+        if kind not in job_queue.tasks:
+            raise click.ClickException(f'No task registered for {kind}.')
+    # Finish the jobs in flight before exiting
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: job_queue.stop())
+    processed = job_queue.work(kinds=kinds, threads=threads or current_app.config['JOB_WORKER_THREADS'],
+                               once=once, poll_interval=current_app.config['JOB_POLL_INTERVAL'])
+    print(f'Processed {processed} jobs.')
+
+
+@jobs_cli.command('status')
+@with_appcontext
+def jobs_status():
+    """Show job counts by kind and status."""
+    for kind, counts in sorted(job_queue.stats().items()):
+        print(kind + ': ' + ', '.join(f'{status} {count}' for status, count in sorted(counts.items())))
+
+
+@jobs_cli.command('retry')
+@click.option('--kind', default=None, help='Only retry failed jobs of this kind.')
+@with_appcontext
+def jobs_retry(kind):
+    """Queue failed jobs again."""
+    print(f'Requeued {job_queue.retry_failed(kind)} failed jobs.')
+
+
+@jobs_cli.command('purge')
+@click.option('--days', type=int, default=7, help='Keep finished jobs for this many days.')
+@with_appcontext
+def jobs_purge(days):
+    """Delete finished and failed jobs."""
+    print(f'Deleted {job_queue.purge(days)} jobs.')
+
+
+@click.command('invite-bulk')
+@click.argument('account_id', type=int)
+@click.argument('inviter')
+@click.argument('csv_file', type=click.File('r'))
+@with_appcontext
+def invite_bulk(account_id, inviter, csv_file):
+    """Invite every email in a CSV file to an account on behalf of INVITER."""
+    from invitations import parse_emails, invite_emails, INVITED
+    user = User.query.filter_by(username=inviter).first()
+    if user is None:
+        raise click.ClickException(f'No user named {inviter}.')
+    if db.session.get(Account, account_id) is None:
+        raise click.ClickException(f'No account with id {account_id}.')
+    
+    results = invite_emails(account_id, user.id, parse_emails(csv_file=csv_file))
+    for email, outcome in results:
+        print(f'{email},{outcome}')
+    sent = sum(1 for _, outcome in results if outcome == INVITED)
+    print(f'{sent} of {len(results)} invitations sent.')
+
+
+@click.command('export')
+@click.argument('name', type=click.Choice(['members', 'invitations', 'logins']))
+@click.option('--account', 'account_id', type=int, help='Account whose members or invitations are exported.')
+@click.option('--user', 'username', default=None, help='Only export the login history of this user.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--since', default=None, help='Only rows on or after this ISO date or time.')
+@click.option('--until', default=None, help='Only rows before this ISO time, or up to the end of this date.')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='File to write (default: stdout).')
+@with_appcontext
+def export_cmd(name, account_id, username, fmt, since, until, compress, output):
+    """Stream members, invitations or login history as CSV or NDJSON."""
+    from exports import generate_export, parse_date
+    params = {}
+    if name in ('members', 'invitations'):
+        if account_id is None:
+            raise click.UsageError(f'--account is required to export {name}.')
+        if db.session.get(Account, account_id) is None:
+            raise click.ClickException(f'No account with id {account_id}.')
+        params['account_id'] = account_id
+    elif username is not None:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}.')
+        params['user_id'] = user.id
+    try:
+        since, until = parse_date(since), parse_date(until, end=True)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    
+    with replica_reads(db.session()):
+        for chunk in generate_export(name, fmt, compress, since, until, **params):
+            output.write(chunk)
+
+
+@click.command('provision-users')
+@click.argument('csv_file', type=click.File('r'))
+@click.option('--batch-size', type=int, default=1000, help='Users inserted per transaction.')
+@click.option('--workers', type=int, default=1, help='Processes used to hash plain-text passwords.')
+@with_appcontext
+def provision_users_cmd(csv_file, batch_size, workers):
+    """Bulk-create users with default accounts from a CSV file.
+
+    The file needs username and email columns plus either password or a
+    precomputed password_hash column.
+    """
+    import csv
+    from registration import provision_users
+    created, skipped = provision_users(csv.DictReader(csv_file), batch_size=batch_size, workers=workers)
+    print(f'Created {created} users, skipped {skipped} existing.')
+
+
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    import os
+    # Apply migrations first with `flask --app app init-db`
+    app = create_app()
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(debug=debug_mode)
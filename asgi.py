@@ -0,0 +1,213 @@
+"""
+ASGI entry point, e.g. `uvicorn asgi:application --workers 4`.
+
+The endpoints in ASGI_ASYNC_ENDPOINTS run on the event loop: the Flask request
+(decorators, flask_login, templates and the models in models.py unchanged)
+runs inside a greenlet whose database calls go through async drivers
+(aiosqlite/asyncpg), so a request waiting on the database or on a file read
+does not hold a thread. Every other endpoint runs in a pool of ASGI_THREADS
+threads exactly as under WSGI.
+"""
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.util import greenlet_spawn
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+from werkzeug.wsgi import FileWrapper
+from database import create_async_engines, async_binds
+
+# Bytes read per thread hop when streaming a file or generator response
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+def _environ(scope, body):
+    """Build a WSGI environ from an ASGI HTTP scope"""
+    script_name = scope.get('root_path', '').encode('utf-8').decode('latin-1')
+    path_info = scope['path'].encode('utf-8').decode('latin-1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _read_chunk(iterator):
+    """Read up to FILE_CHUNK_SIZE bytes from a response iterator"""
+    parts, size = [], 0
+    for part in iterator:
+        parts.append(part)
+        size += len(part)
+        if size >= FILE_CHUNK_SIZE:
+            break
+    return b''.join(parts)
+
+
+class AsgiApplication:
+    """Serve a Flask app over ASGI with async database access for hot read routes
+
+    Async endpoints only take GET and HEAD requests and must not write to the
+    database outside of what their views already do. Files returned by those
+    views (send_file) are streamed with reads done in worker threads.
+    """
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.async_endpoints = frozenset(app.config.get('ASGI_ASYNC_ENDPOINTS', ()))
+        self.executor = ThreadPoolExecutor(max_workers=app.config.get('ASGI_THREADS', 16),
+                                           thread_name_prefix='asgi-wsgi')
+        self.engines = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = await self._read_body(receive)
+            environ = _environ(scope, body)
+            if self._is_async(environ):
+                status, headers, chunks, file_body = await self._run_async(environ)
+                context = contextvars.copy_context()
+            else:
+                # The body is read in the same context as the call, so a generator
+                # that pushed a Flask context (stream_with_context) finds it again
+                context = contextvars.copy_context()
+                status, headers, chunks, file_body = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, context.run, self._run_sync, environ)
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await self._send_body(send, chunks, file_body, context)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    def _is_async(self, environ):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return False
+        adapter = self.app.url_map.bind_to_environ(environ)
+        try:
+            endpoint, _ = adapter.match()
+        except (HTTPException, RequestRedirect):
+            return False
+        return endpoint in self.async_endpoints
+
+    async def _run_async(self, environ):
+        if self.engines is None:
+            with self.app.app_context():
+                self.engines = create_async_engines(self.app, self.db)
+        with async_binds(self.engines):
+            return await greenlet_spawn(self._call_app, environ, True)
+
+    def _run_sync(self, environ):
+        return self._call_app(environ, False)
+
+    def _call_app(self, environ, stream_files):
+        """Call the WSGI app, returning status, headers and the body iterable"""
+        response = {'file': False}
+
+        def file_wrapper(file, buffer_size=8192):
+            response['file'] = True
+            return FileWrapper(file, buffer_size)
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        if stream_files:
+            environ['wsgi.file_wrapper'] = file_wrapper
+        app_iter = self.app(environ, start_response)
+        streamed = not any(name == b'content-length' for name, _ in response['headers'])
+        if response['file'] or (streamed and not stream_files):
+            # Files, and generator responses such as exports, are read chunk by
+            # chunk in worker threads instead of being buffered whole
+            return response['status'], response['headers'], app_iter, True
+        # Rendered pages are already in memory
+        try:
+            return response['status'], response['headers'], list(app_iter), False
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    async def _send_body(self, send, chunks, file_body, context):
+        if not file_body:
+            for chunk in chunks:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        else:
+            iterator = iter(chunks)
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(None, context.run, _read_chunk, iterator)
+                    if not chunk:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(chunks, 'close'):
+                    await loop.run_in_executor(None, context.run, chunks.close)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def _read_body(self, receive):
+        parts = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            parts.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(parts)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engines is not None:
+                    for engine in [self.engines['primary']] + self.engines['replicas']:
+                        await engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(app=None):
+    """Wrap an app (by default a new, preloaded one) for ASGI servers"""
+    from models import db
+    if app is None:
+        from app import create_app, preload
+        app = create_app()
+        preload(app)
+    return AsgiApplication(app, db)
+
+
+application = create_asgi_app()
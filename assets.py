@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from flask import current_app, request, send_file, abort, url_for
+from werkzeug.local import LocalProxy
+from werkzeug.security import safe_join
+from compression import choose_encoding, compress, supported_encodings
+
+MANIFEST = 'manifest.json'
+
+# Pre-compressed variants written next to each bundle
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+
+def minify_css(css):
+    """Strip comments and insignificant whitespace from a stylesheet"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+class AssetPipeline:
+    """Content-hashed static bundles with pre-compressed variants
+
+    Each ASSET_BUNDLES entry concatenates source files from the static folder
+    into ASSET_OUTPUT_DIR/<name>.<hash><ext>, minified, with .gz (and .br when
+    the brotli package is installed) variants next to it. `flask build-assets`
+    builds every bundle and writes a manifest that templates read through
+    asset_url(); with ASSETS_AUTO_BUILD, bundles missing from the manifest are
+    built on first use instead (and rebuilt in debug mode when a source file
+    changes). Bundles are served from /assets with immutable caching and the
+    best pre-compressed variant the client accepts.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.bundles = app.config.get('ASSET_BUNDLES', {})
+        self.source_dir = app.static_folder
+        self.output_dir = app.config.get('ASSET_OUTPUT_DIR') or os.path.join(app.static_folder, 'dist')
+        self.auto_build = app.config.get('ASSETS_AUTO_BUILD', True)
+        self.manifest = self._read_manifest()
+        app.add_url_rule('/assets/<path:filename>', 'asset', self.send_asset)
+        app.add_template_global(self.asset_url)
+        app.extensions['asset_pipeline'] = self
+
+    def asset_url(self, name):
+        """URL of the current build of a bundle"""
+        entry = self.manifest.get(name)
+        if self.auto_build and (entry is None or (current_app.debug and self._stale(entry))):
+            entry = self.build(name)
+        if entry is None:
+            raise KeyError(f'Asset bundle {name} has not been built; run `flask build-assets`')
+        return url_for('asset', filename=entry['file'])
+
+    def build_all(self):
+        """Build every bundle and rewrite the manifest"""
+        return [self.build(name) for name in self.bundles]
+
+    def build(self, name):
+        """Build one bundle, returning its manifest entry"""
+        sources = self.bundles[name]
+        contents = []
+        for source in sources:
+            with open(os.path.join(self.source_dir, source), encoding='utf-8') as f:
+                contents.append(f.read())
+        stem, ext = os.path.splitext(name)
+        text = '\n'.join(contents)
+        data = (minify_css(text) if ext == '.css' else text).encode('utf-8')
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, filename)
+        self._write(path, data)
+        for encoding in supported_encodings():
+            self._write(path + SUFFIXES[encoding], compress(data, encoding, level=9, brotli_quality=11))
+
+        entry = {'file': filename, 'sources': {source: self._mtime(source) for source in sources}}
+        with self._lock:
+            self.manifest = dict(self.manifest, **{name: entry})
+            self._write(os.path.join(self.output_dir, MANIFEST),
+                        json.dumps(self.manifest, indent=2, sort_keys=True).encode('utf-8'))
+        return entry
+
+    def send_asset(self, filename):
+        """Serve a built bundle, pre-compressed when the client allows it"""
+        path = safe_join(self.output_dir, filename)
+        if path is None or filename == MANIFEST or os.path.splitext(filename)[1] not in MIMETYPES:
+            abort(404)
+        encoding = choose_encoding(request, [e for e in supported_encodings()
+                                             if os.path.exists(path + SUFFIXES[e])])
+        served = path + SUFFIXES[encoding] if encoding else path
+        if not os.path.isfile(served):
+            abort(404)
+        response = send_file(served, mimetype=MIMETYPES[os.path.splitext(filename)[1]],
+                             max_age=current_app.config.get('ASSET_CACHE_MAX_AGE', 31536000),
+                             conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.output_dir, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _stale(self, entry):
+        return any(self._mtime(source) != mtime for source, mtime in entry['sources'].items())
+
+    def _mtime(self, source):
+        return os.stat(os.path.join(self.source_dir, source)).st_mtime_ns
+
+    @staticmethod
+    def _write(path, data):
+        # Write then rename so concurrent readers never see a partial file
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+# The instance create_app made for the current app
+asset_pipeline = LocalProxy(lambda: current_app.extensions['asset_pipeline'])
@@ -0,0 +1,358 @@
+"""
+Route benchmark: seeds a SQLite database and measures every main route.
+
+Runs fully offline. Requests go through the Flask test client by default, or
+through a real threaded WSGI server with --server. Results (throughput,
+latency percentiles and SQL queries per request for each route) are printed
+as JSON. With --startup it instead measures worker cold start: import,
+create_app and first request times in fresh processes, and the time from
+fork to first response for workers forked from a preloaded parent.
+
+    python benchmark.py --users 1000 --members 50 --requests 500 --concurrency 8
+    python benchmark.py --startup --startup-runs 10
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+ROUTES = ('login', 'dashboard', 'account', 'invitations', 'invite', 'uploads')
+PASSWORD = 'benchmark-password'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=200, help='users to seed, each with a default account')
+    parser.add_argument('--members', type=int, default=20, help='extra members added to each account')
+    parser.add_argument('--invitations', type=int, default=5, help='pending invitations received per user')
+    parser.add_argument('--logins', type=int, default=50, help='login history rows per user')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent clients')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma-separated routes to run')
+    parser.add_argument('--server', action='store_true', help='drive a real threaded WSGI server over HTTP')
+    parser.add_argument('--database', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--hash-method', default='pbkdf2:sha256:1000',
+                        help='password hash method for seeded users and logins')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    parser.add_argument('--startup', action='store_true', help='measure worker startup instead of routes')
+    parser.add_argument('--startup-runs', type=int, default=5, help='fresh processes per startup mode')
+    parser.add_argument('--startup-child', choices=('cold', 'preloaded'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def load_app(args):
+    """Import the app configured for benchmarking"""
+    workdir = tempfile.mkdtemp(prefix='flask-first-bench-')
+    database = args.database or os.path.join(workdir, 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(database)}'
+    os.environ['PASSWORD_HASH_METHOD'] = args.hash_method
+    os.environ['PROFILING_ENABLED'] = 'true'
+    # Every simulated user logs in from the same address
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    from app import create_app
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['UPLOAD_FOLDER'] = os.path.join(workdir, 'uploads')
+    app.config['PROFILING_CPROFILE_SAMPLE_RATE'] = 0
+    app.config['PROFILING_QUERY_BUDGET'] = 10 ** 9
+    return app
+
+
+def seed(app, args):
+    """Create users, accounts, memberships, invitations, login history and an upload"""
+    from sqlalchemy import insert
+    from models import db, User, Account, AccountMember, Invitation, LoginHistory
+    from login_stats import rebuild_login_stats
+    from registration import provision_users
+    from passwords import password_hasher
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        db.create_all()
+        password_hash = password_hasher.hash(PASSWORD)
+        provision_users(({'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash}
+                         for i in range(args.users)), batch_size=1000)
+
+        users = db.session.query(User.id, User.email).order_by(User.id).all()
+        accounts = db.session.query(Account.id, Account.owner_id).order_by(Account.id).all()
+        user_ids = [user.id for user in users]
+
+        members = []
+        for account_id, owner_id in accounts:
+            for user_id in rng.sample(user_ids, min(args.members, len(user_ids))):
+                if user_id != owner_id:
+                    members.append({'account_id': account_id, 'user_id': user_id, 'is_admin': False})
+        if members:
+            db.session.execute(insert(AccountMember), members)
+
+        invitations = []
+        for user_id, email in users:
+            for account_id, owner_id in rng.sample(accounts, min(args.invitations, len(accounts))):
+                invitations.append({'account_id': account_id, 'inviter_id': owner_id, 'invitee_email': email})
+        if invitations:
+            db.session.execute(insert(Invitation), invitations)
+
+        now = datetime.utcnow()
+        logins = [{'user_id': user_id, 'login_time': now - timedelta(minutes=rng.randint(0, 60 * 24 * 60))}
+                  for user_id in user_ids for _ in range(args.logins)]
+        for start in range(0, len(logins), 10000):
+            db.session.execute(insert(LoginHistory), logins[start:start + 10000])
+        db.session.commit()
+        rebuild_login_stats()
+
+        accounts_by_owner = {owner_id: account_id for account_id, owner_id in accounts}
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    upload = 'benchmark-avatar.png'
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], upload), 'wb') as f:
+        f.write(os.urandom(100 * 1024))
+
+    return [{'id': user_id, 'username': f'user{index}', 'account_id': accounts_by_owner[user_id]}
+            for index, user_id in enumerate(user_ids)], upload
+
+
+class TestClientDriver:
+    """Issue requests through the Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def client(self, user, authenticated=True):
+        if not authenticated:
+            return self.app.test_client(use_cookies=False)
+        client = self.app.test_client()
+        client.post('/login', data={'username': user['username'], 'password': PASSWORD})
+        return client
+
+    def request(self, client, method, path, data=None):
+        response = client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code
+
+
+class ServerDriver:
+    """Issue requests over HTTP to a threaded WSGI server running in this process"""
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+        # Per-request access logs would dominate the measurement
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def client(self, user, authenticated=True):
+        state = {'conn': http.client.HTTPConnection('127.0.0.1', self.port), 'cookie': '',
+                 'keep_cookies': authenticated}
+        if authenticated:
+            self.request(state, 'POST', '/login', {'username': user['username'], 'password': PASSWORD})
+        return state
+
+    def request(self, state, method, path, data=None):
+        headers = {'Cookie': state['cookie']}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        state['conn'].request(method, path, body=body, headers=headers)
+        response = state['conn'].getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie')
+        if state['keep_cookies'] and cookie and cookie.startswith('session='):
+            state['cookie'] = cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self):
+        self.server.shutdown()
+
+
+def route_request(route, user, upload, counter):
+    """Method, path and form data for one request to a route"""
+    if route == 'login':
+        return 'POST', '/login', {'username': user['username'], 'password': PASSWORD}
+    if route == 'dashboard':
+        return 'GET', '/dashboard', None
+    if route == 'account':
+        return 'GET', f"/account/{user['account_id']}", None
+    if route == 'invitations':
+        return 'GET', '/invitations', None
+    if route == 'invite':
+        return 'POST', f"/account/{user['account_id']}/invite", {'email': f"bench-{user['id']}-{next(counter)}@example.com"}
+    if route == 'uploads':
+        return 'GET', f'/uploads/{upload}', None
+    raise ValueError(f'Unknown route: {route}')
+
+
+def run_route(driver, route, users, upload, args):
+    """Run args.requests requests against a route across args.concurrency clients"""
+    # Logged-in clients are redirected away from /login, so login requests are sent without cookies
+    clients = [(driver.client(user, authenticated=route != 'login'), user) for user in users[:args.concurrency]]
+    per_client = [args.requests // len(clients) + (i < args.requests % len(clients)) for i in range(len(clients))]
+    latencies = []
+    errors = []
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def worker(client, user, count):
+        local = []
+        for _ in range(count):
+            with lock:
+                method, path, data = route_request(route, user, upload, counter)
+            start = time.perf_counter()
+            status = driver.request(client, method, path, data)
+            local.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(client, user, count))
+               for (client, user), count in zip(clients, per_client)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(route, latencies, errors, elapsed, endpoint_stats):
+    return {
+        'route': route,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p90': round(percentile(latencies, 90) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(max(latencies) * 1000, 3),
+        },
+        'queries_per_request': (round(endpoint_stats.sql_queries / endpoint_stats.requests, 2)
+                                if endpoint_stats else None),
+    }
+
+
+def startup_child(mode):
+    """Time one worker start in this fresh process and print the result as JSON"""
+    started = time.perf_counter()
+    from app import create_app, preload
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    result = {'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000}
+
+    if mode == 'cold':
+        app.test_client().get('/login').close()
+        result['first_request_ms'] = (time.perf_counter() - created) * 1000
+        result['ready_ms'] = (time.perf_counter() - started) * 1000
+    else:
+        preload(app)
+        result['preload_ms'] = (time.perf_counter() - created) * 1000
+        # A pre-fork server pays the costs above once; each worker only pays from fork onwards
+        read_fd, write_fd = os.pipe()
+        forked = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            app.test_client().get('/login').close()
+            os.write(write_fd, str(time.perf_counter() - forked).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            elapsed = float(pipe.read())
+        os.waitpid(pid, 0)
+        result['first_request_ms'] = elapsed * 1000
+        result['ready_ms'] = elapsed * 1000
+    print(json.dumps(result))
+
+
+def run_startup(args):
+    """Run --startup-runs fresh processes per mode and summarize their timings"""
+    workdir = tempfile.mkdtemp(prefix='flask-first-startup-')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'startup.db')}")
+    modes = {}
+    for mode in ('cold', 'preloaded'):
+        runs = []
+        for _ in range(args.startup_runs):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--startup-child', mode],
+                                    env=env, check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        modes[mode] = {key: round(statistics.median(run[key] for run in runs), 3) for key in runs[0]}
+    return {'mode': 'startup', 'runs': args.startup_runs, 'median_ms': modes}
+
+
+ENDPOINTS = {'login': 'login', 'dashboard': 'dashboard', 'account': 'view_account',
+             'invitations': 'view_invitations', 'invite': 'invite_user', 'uploads': 'uploaded_file'}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.startup_child:
+        return startup_child(args.startup_child)
+    if args.startup:
+        return write_report(run_startup(args), args)
+    random.seed(args.seed)
+    app = load_app(args)
+
+    started = time.perf_counter()
+    users, upload = seed(app, args)
+    seed_seconds = time.perf_counter() - started
+
+    request_profiler = app.extensions['request_profiler']
+    driver = ServerDriver(app) if args.server else TestClientDriver(app)
+    results = []
+    try:
+        for route in args.routes.split(','):
+            endpoint = ENDPOINTS[route]
+            # Only count the queries issued by the measured requests
+            request_profiler.stats.clear()
+            latencies, errors, elapsed = run_route(driver, route, users, upload, args)
+            results.append(summarize(route, latencies, errors, elapsed, request_profiler.stats.get(endpoint)))
+    finally:
+        if args.server:
+            driver.close()
+
+    report = {
+        'mode': 'server' if args.server else 'test_client',
+        'scale': {'users': args.users, 'members': args.members, 'invitations': args.invitations,
+                  'logins': args.logins},
+        'requests_per_route': args.requests,
+        'concurrency': args.concurrency,
+        'seed_seconds': round(seed_seconds, 3),
+        'routes': results,
+    }
+    write_report(report, args)
+
+
+def write_report(report, args):
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import gzip
+from flask import current_app, request, g
+from werkzeug.local import LocalProxy
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+def supported_encodings():
+    """Content encodings this process can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(request, available):
+    """Pick the encoding from available the client accepts, preferring earlier entries"""
+    accepted = request.accept_encodings
+    for encoding in available:
+        if accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, level=6, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+class ResponseCompression:
+    """Compress dynamic responses for clients that accept gzip or brotli
+
+    Applies to buffered responses with a COMPRESS_MIMETYPES content type of at
+    least COMPRESS_MIN_SIZE bytes. Streamed and file responses (send_file) and
+    responses that already carry a Content-Encoding are left alone. So that
+    the compressed size cannot leak secrets (BREACH), pages that render a
+    CSRF token or answer a request carrying a query string or body are sent
+    uncompressed as well.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('COMPRESS_ENABLED', True):
+            return
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ('text/html',)))
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+        app.after_request(self._compress)
+        app.extensions['response_compression'] = self
+
+    def _compress(self, response):
+        if (response.mimetype not in self.mimetypes or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300 or self._may_leak_secrets()):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        encoding = choose_encoding(request, supported_encodings())
+        if encoding is None:
+            return response
+        response.set_data(compress(data, encoding, self.level, self.brotli_quality))
+        response.headers['Content-Encoding'] = encoding
+        if response.get_etag()[0]:
+            # A strong ETag names the uncompressed bytes
+            response.set_etag(response.get_etag()[0], weak=True)
+        return response
+
+    @staticmethod
+    def _may_leak_secrets():
+        # A CSRF token next to input an attacker can set through a cross-site
+        # request lets them guess the token from the compressed length
+        if current_app.config.get('WTF_CSRF_FIELD_NAME', 'csrf_token') in g:
+            return True
+        return bool(request.query_string) or request.method not in ('GET', 'HEAD')
+
+
+# The instance create_app made for the current app
+response_compression = LocalProxy(lambda: current_app.extensions['response_compression'])
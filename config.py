@@ -5,7 +5,201 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite connection pragmas, applied to every new connection
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT_MS = 5000
+    SQLITE_CACHE_SIZE = -20000  # negative values are KiB, so about 20MB
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    
+    # Connection pool for server databases (PostgreSQL, MySQL)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_RECYCLE = 1800  # seconds
+    DB_POOL_TIMEOUT = 30  # seconds
+    DB_POOL_PRE_PING = True
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS') or 0)  # PostgreSQL only, 0 disables
+    
+    # Read replicas used by read-only views, as a comma-separated list of URLs
+    SQLALCHEMY_REPLICA_URIS = [url for url in (os.environ.get('DATABASE_REPLICA_URLS') or '').split(',') if url]
+    # Keep a browser session on the primary this long after it writes, to hide replication lag
+    REPLICA_STICKY_SECONDS = 5
+    
+    # Password hashing parameters passed to werkzeug; stored hashes made with
+    # other parameters are upgraded on the next successful login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_SALT_LENGTH = 16
+    # Hash passwords in this many worker processes instead of the request thread (0 disables)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 0)
+    
+    # Per-request timing, SQL and template instrumentation exported at PROFILING_METRICS_PATH
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILING_QUERY_BUDGET = 20  # warn when a request issues more SQL statements than this
+    PROFILING_CPROFILE_SAMPLE_RATE = float(os.environ.get('PROFILING_CPROFILE_SAMPLE_RATE') or 0)
+    PROFILING_DUMP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+    PROFILING_METRICS_PATH = '/internal/metrics'
+    # Who may read the metrics: requests with `Authorization: Bearer <token>`,
+    # or from these client addresses. Both are unset by default, so the
+    # endpoint answers 404. Loopback addresses are only honoured with
+    # PROXY_FIX_X_FOR set, since a proxy on the same host looks like loopback
+    PROFILING_METRICS_TOKEN = os.environ.get('PROFILING_METRICS_TOKEN')
+    PROFILING_METRICS_ALLOWED_IPS = [ip for ip in (os.environ.get('PROFILING_METRICS_ALLOWED_IPS') or '').split(',') if ip]
+    
+    # Rows per page for member and invitation lists on the account page
+    ACCOUNT_PAGE_SIZE = 50
+    
     # File upload configuration
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB file size limit
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
\ No newline at end of file
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    
+    # Square WebP variants generated for each profile image (name: pixel size)
+    PROFILE_IMAGE_SIZES = {'thumb': 40, 'medium': 150, 'large': 300}
+    
+    # Uploaded files are immutable, so browsers may cache them for a year
+    UPLOAD_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+    # Let the front-end server send upload bytes: None, 'X-Sendfile' or 'X-Accel-Redirect'
+    UPLOAD_SENDFILE_HEADER = os.environ.get('UPLOAD_SENDFILE_HEADER') or None
+    UPLOAD_ACCEL_PREFIX = '/protected-uploads/'
+    
+    # Raw login history older than this is folded into daily rollups by `flask compact-logins`
+    LOGIN_HISTORY_RETENTION_DAYS = int(os.environ.get('LOGIN_HISTORY_RETENTION_DAYS') or 90)
+    
+    # Buffer login events and write them in batches from a background thread
+    LOGIN_WRITE_BEHIND = os.environ.get('LOGIN_WRITE_BEHIND', 'False').lower() == 'true'
+    LOGIN_WRITE_BATCH_SIZE = 500
+    LOGIN_WRITE_FLUSH_INTERVAL = 1.0  # seconds
+    LOGIN_WRITE_QUEUE_SIZE = 10000
+    
+    # Cache used by the Flask-Login user loader: 'memory', 'redis' or 'null'.
+    # A changed user is only dropped from the backend of the worker that made
+    # the change, so with 'memory' other workers serve the old row for up to
+    # USER_CACHE_TTL seconds; production defaults to the shared 'redis' backend
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND') or 'memory'
+    USER_CACHE_TTL = 300  # seconds
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_REDIS_URL = os.environ.get('USER_CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    
+    # Cache each user's account role map across requests (0 keeps it per-request only).
+    # Role changes are only dropped from the backend of the worker that made
+    # them, so 'memory' leaves other workers granting revoked access for up to
+    # ACL_CACHE_TTL seconds; keep the shared 'redis' backend unless the app
+    # runs in a single process
+    ACL_CACHE_TTL = int(os.environ.get('ACL_CACHE_TTL') or 0)
+    ACL_CACHE_BACKEND = os.environ.get('ACL_CACHE_BACKEND') or 'redis'
+    ACL_CACHE_SIZE = 10000  # entries kept by the memory backend
+    ACL_CACHE_REDIS_URL = os.environ.get('ACL_CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    
+    # Cache rendered template fragments ('memory', 'redis' or 'null'); the memory
+    # backend is per process, so use redis when running several workers
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND') or 'null'
+    FRAGMENT_CACHE_TTL = 3600  # seconds
+    FRAGMENT_CACHE_SIZE = 5000
+    FRAGMENT_CACHE_REDIS_URL = os.environ.get('FRAGMENT_CACHE_REDIS_URL') or 'redis://localhost:6379/0'
+    
+    # ASGI serving mode (asgi.py): these endpoints run on the event loop with async
+    # database drivers, every other endpoint in a pool of ASGI_THREADS threads
+    ASGI_ASYNC_ENDPOINTS = ('dashboard', 'view_account', 'view_invitations', 'uploaded_file')
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS') or 16)
+    
+    # Static bundles (output name: source files under static/), built by `flask build-assets`
+    ASSET_BUNDLES = {'app.css': ['style.css']}
+    ASSET_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dist')
+    # Build bundles missing from the manifest on first use instead of failing
+    ASSETS_AUTO_BUILD = os.environ.get('ASSETS_AUTO_BUILD', 'True').lower() == 'true'
+    ASSET_CACHE_MAX_AGE = 31536000  # one year; bundle names change with their content
+    
+    # gzip/brotli compression of dynamic responses. Pages with a CSRF token and
+    # responses to requests with a query string or body are sent uncompressed
+    # so their size cannot leak secrets (BREACH)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'True').lower() == 'true'
+    COMPRESS_MIMETYPES = ('text/html', 'application/json', 'text/plain')
+    COMPRESS_MIN_SIZE = 500  # bytes
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 4
+    
+    # Reverse proxies in front of the app whose X-Forwarded-For/-Proto/-Host
+    # headers are trusted (werkzeug ProxyFix). 0 trusts none, so the client
+    # address is the socket peer; behind a proxy set PROXY_FIX_X_FOR to the
+    # number of proxies, or rate limits see every client as the proxy
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+    PROXY_FIX_X_PROTO = int(os.environ.get('PROXY_FIX_X_PROTO') or 0)
+    PROXY_FIX_X_HOST = int(os.environ.get('PROXY_FIX_X_HOST') or 0)
+    
+    # Admission control for expensive endpoints (ratelimit.py)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True').lower() == 'true'
+    # Token buckets: 'memory' (per process) or 'redis' (shared by all workers)
+    RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND') or 'memory'
+    RATELIMIT_REDIS_URL = os.environ.get('RATELIMIT_REDIS_URL') or 'redis://localhost:6379/0'
+    RATELIMIT_STORE_SIZE = 100000  # buckets kept by the memory backend
+    RATELIMIT_METHODS = ('POST',)
+    # Budgets per endpoint, keyed by 'ip', 'username' (form field) or 'user' (logged in):
+    # (requests, seconds) allows bursts of that many requests refilled over that period
+    RATELIMIT_RULES = {
+        'login': {'ip': (30, 60), 'username': (10, 300)},
+        'register': {'ip': (10, 3600)},
+        'profile': {'user': (20, 300)},
+    }
+    # Requests of each group running at once per process; the rest wait up to
+    # CONCURRENCY_QUEUE_TIMEOUT seconds and are then shed with a 503
+    CONCURRENCY_LIMITS = {'password_hash': 8, 'upload': 4}
+    CONCURRENCY_GROUPS = {'login': 'password_hash', 'register': 'password_hash', 'profile': 'upload'}
+    CONCURRENCY_QUEUE_TIMEOUT = 0.25
+    CONCURRENCY_RETRY_AFTER = 1  # seconds
+    
+    # Background job worker (`flask jobs work`)
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS') or 4)
+    JOB_POLL_INTERVAL = 1.0  # seconds between polls when no jobs are due
+    JOB_MAX_ATTEMPTS = 5
+    JOB_BACKOFF_BASE = 10  # seconds before the first retry, doubled on each attempt
+    JOB_BACKOFF_MAX = 3600  # seconds
+    JOB_LOCK_TIMEOUT = 600  # requeue running jobs whose worker stopped refreshing their lock this long ago
+    # Cap on running batches per kind across all workers, overriding the task's own limit
+    JOB_CONCURRENCY = {}
+    # Recurring jobs (kind: interval in seconds) queued by the worker. Empty by
+    # default: e.g. compact_logins deletes raw login history, so opt in with
+    # {'compact_logins': 24 * 60 * 60} to compact daily
+    JOB_SCHEDULE = {}
+    # Modules imported by the worker so their tasks are registered
+    JOB_TASK_MODULES = ('invitations', 'images', 'login_stats')
+    
+    # Outgoing mail: 'console', 'memory', 'smtp' or a 'module:Class' transport
+    MAIL_TRANSPORT = os.environ.get('MAIL_TRANSPORT') or 'console'
+    MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'False').lower() == 'true'
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER') or 'no-reply@localhost'
+    # Used to build links in emails, which are rendered outside of a request
+    APP_BASE_URL = os.environ.get('APP_BASE_URL') or 'http://localhost:5000'
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS') or 15000)
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND') or 'redis'
+
+
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    USER_CACHE_BACKEND = 'null'
+    MAIL_TRANSPORT = 'memory'
+    RATELIMIT_ENABLED = False
+
+
+# Selected with the APP_CONFIG environment variable
+config = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+    'default': Config,
+}
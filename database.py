@@ -0,0 +1,199 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Replica engines are registered as binds named replica_0, replica_1, ...
+REPLICA_PREFIX = 'replica_'
+
+# Async drivers used by the ASGI serving mode, by database backend
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg', 'mysql': 'aiomysql'}
+
+
+def engine_options(config):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for the configured database
+
+    SQLite gets a busy timeout at the driver level (pragmas are applied per
+    connection by apply_sqlite_pragmas). Server databases get pool sizing,
+    recycling and pre-ping, plus a statement timeout on PostgreSQL.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() == 'postgresql' and config.get('DB_STATEMENT_TIMEOUT_MS'):
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def configure_engine(app):
+    """Fill in engine options and replica binds from config; call before db.init_app"""
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for index, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or []):
+        options = engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=uri))
+        binds[f'{REPLICA_PREFIX}{index}'] = dict(options, url=uri)
+
+
+def sqlite_pragmas(config):
+    """PRAGMA values from the SQLITE_* settings, leaving out unset ones"""
+    pragmas = {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'cache_size': config['SQLITE_CACHE_SIZE'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+    }
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def apply_sqlite_pragmas(app, db):
+    """Apply the app's SQLITE_* pragmas to new connections of its SQLite engines; call after db.init_app
+
+    The listener is registered per engine with the app's own values, so apps
+    with different settings in one process do not affect each other.
+    """
+    pragmas = sqlite_pragmas(app.config)
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.url.get_backend_name() == 'sqlite':
+            event.listen(engine, 'connect', partial(_set_sqlite_pragmas, pragmas))
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def create_async_engines(app, db):
+    """Create async engines mirroring the primary and replica engines of db
+
+    Used by the ASGI serving mode. URLs are taken from the configured engines so
+    relative SQLite paths resolve to the same files, with the driver replaced
+    by the backend's entry in ASYNC_DRIVERS. Call inside an app context.
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    def build(engine):
+        url = engine.url
+        backend = url.get_backend_name()
+        if backend not in ASYNC_DRIVERS:
+            raise ValueError(f'No async driver configured for {backend} databases')
+        options = engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=url))
+        if backend == 'postgresql' and 'connect_args' in options:
+            # asyncpg takes server settings instead of libpq options
+            options['connect_args'] = {'server_settings': {'statement_timeout': str(app.config['DB_STATEMENT_TIMEOUT_MS'])}}
+        async_engine = create_async_engine(url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}'), **options)
+        if backend == 'sqlite':
+            event.listen(async_engine.sync_engine, 'connect', partial(_set_sqlite_pragmas, sqlite_pragmas(app.config)))
+        return async_engine
+
+    return {
+        'primary': build(db.engines[None]),
+        'replicas': [build(engine) for key, engine in db.engines.items()
+                     if key is not None and key.startswith(REPLICA_PREFIX)],
+    }
+
+
+# Async engines the current ASGI request runs against (see async_binds)
+_async_engines = ContextVar('async_engines', default=None)
+
+
+@contextmanager
+def async_binds(engines):
+    """Run sessions inside the block on the async engines from create_async_engines
+
+    Statements must then be issued from a greenlet started with
+    sqlalchemy.util.greenlet_spawn, which awaits the driver without blocking
+    the event loop.
+    """
+    token = _async_engines.set(engines)
+    try:
+        yield
+    finally:
+        _async_engines.reset(token)
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica inside read-only handlers
+
+    Reads go to a randomly chosen replica only while session.info['use_replica']
+    is set (see read_only and replica_reads). Flushes, DML statements and
+    everything after the first write in the session go to the primary, so a
+    request always reads its own writes. After a committed write the browser
+    session is also pinned to the primary for REPLICA_STICKY_SECONDS to cover
+    replication lag on the redirect that usually follows. Inside async_binds
+    the same routing picks between the async engines instead.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        async_engines = _async_engines.get()
+        if bind is None and async_engines is not None:
+            if self._use_replica(clause) and async_engines['replicas']:
+                return random.choice(async_engines['replicas']).sync_engine
+            return async_engines['primary'].sync_engine
+        if bind is None and self._use_replica(clause):
+            replicas = [engine for key, engine in self._db.engines.items()
+                        if key is not None and key.startswith(REPLICA_PREFIX)]
+            if replicas:
+                return random.choice(replicas)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.info['wrote'] = True
+            return False
+        if clause is not None and getattr(clause, '_for_update_arg', None) is not None:
+            return False
+        return self.info.get('use_replica', False) and not self.info.get('wrote', False)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_to_primary(session):
+    """Keep this browser session on the primary for a while after it wrote"""
+    if not session.info.get('wrote') or not has_request_context():
+        return
+    sticky_seconds = current_app.config.get('REPLICA_STICKY_SECONDS', 0)
+    if sticky_seconds:
+        flask_session['_primary_until'] = time.time() + sticky_seconds
+
+
+def _pinned_to_primary():
+    return has_request_context() and flask_session.get('_primary_until', 0) > time.time()
+
+
+@contextmanager
+def replica_reads(session):
+    """Route reads inside the block to a replica unless the session has written"""
+    previous = session.info.get('use_replica', False)
+    session.info['use_replica'] = not _pinned_to_primary()
+    try:
+        yield
+    finally:
+        session.info['use_replica'] = previous
+
+
+def read_only(db):
+    """Decorator for views that only read, letting their queries use a replica"""
+    def decorator(view):
+        @wraps(view)
+        def decorated(*args, **kwargs):
+            with replica_reads(db.session()):
+                return view(*args, **kwargs)
+        return decorated
+    return decorator
@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, case
+from models import db, User, Account, AccountMember, Invitation, LoginHistory
+
+# Output formats and their content types
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+# Rows fetched from the cursor at a time
+YIELD_PER = 1000
+
+# Bytes buffered before a chunk is handed to the response (or compressor)
+CHUNK_SIZE = 64 * 1024
+
+
+def members_query(account_id):
+    """Members of an account in join order, with their role"""
+    role = case((Account.owner_id == AccountMember.user_id, 'owner'),
+                (AccountMember.is_admin, 'admin'), else_='member')
+    stmt = select(
+        AccountMember.user_id, User.username, User.email, role.label('role'), AccountMember.joined_at
+    ).join(User, User.id == AccountMember.user_id).join(Account, Account.id == AccountMember.account_id).where(
+        AccountMember.account_id == account_id
+    ).order_by(AccountMember.joined_at, AccountMember.id)
+    return stmt, AccountMember.joined_at
+
+
+def invitations_query(account_id):
+    """Every invitation sent for an account, whatever its status"""
+    stmt = select(
+        Invitation.id, Invitation.invitee_email, User.username.label('inviter'), Invitation.status,
+        Invitation.created_at, Invitation.responded_at
+    ).join(User, User.id == Invitation.inviter_id).where(
+        Invitation.account_id == account_id
+    ).order_by(Invitation.created_at, Invitation.id)
+    return stmt, Invitation.created_at
+
+
+def logins_query(user_id=None):
+    """Raw login history of one user, or of everyone in id order"""
+    stmt = select(
+        LoginHistory.id, LoginHistory.user_id, User.username, LoginHistory.login_time
+    ).join(User, User.id == LoginHistory.user_id)
+    if user_id is not None:
+        stmt = stmt.where(LoginHistory.user_id == user_id).order_by(LoginHistory.login_time, LoginHistory.id)
+    else:
+        stmt = stmt.order_by(LoginHistory.id)
+    return stmt, LoginHistory.login_time
+
+
+# Export name: function returning (statement, column the date range applies to)
+EXPORTS = {'members': members_query, 'invitations': invitations_query, 'logins': logins_query}
+
+
+def parse_date(value, end=False):
+    """Parse an ISO date or datetime filter; a bare end date includes that whole day"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def export_rows(name, since=None, until=None, **params):
+    """Return the column names and a result streaming rows YIELD_PER at a time
+
+    since is inclusive and until exclusive; both are datetimes or None.
+    """
+    stmt, date_column = EXPORTS[name](**params)
+    if since is not None:
+        stmt = stmt.where(date_column >= since)
+    if until is not None:
+        stmt = stmt.where(date_column < until)
+    # yield_per keeps a bounded number of rows in memory and uses a
+    # server-side cursor on drivers that support one (psycopg2, asyncpg)
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    return list(result.keys()), result
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def serialize(columns, rows, fmt):
+    """Yield the export as text, one line per row"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([_value(value) for value in row])
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    elif fmt == 'ndjson':
+        for row in rows:
+            yield json.dumps({column: _value(value) for column, value in zip(columns, row)}) + '\n'
+    else:
+        raise ValueError(f'Unknown export format: {fmt}')
+
+
+def encode(lines, compress=False, level=6):
+    """Join text into byte chunks of about CHUNK_SIZE, gzip-compressed on the fly if asked"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) if compress else None
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            data = ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = ''.join(parts).encode('utf-8')
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def generate_export(name, fmt='csv', compress=False, since=None, until=None, **params):
+    """Yield an export as bytes without holding more than a batch of rows in memory"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format: {fmt}')
+    columns, rows = export_rows(name, since=since, until=until, **params)
+    try:
+        yield from encode(serialize(columns, rows, fmt), compress=compress)
+    finally:
+        rows.close()
+
+
+def export_filename(name, fmt, compress=False):
+    stamp = datetime.utcnow().strftime('%Y%m%d')
+    return f"{name}-{stamp}.{fmt}{'.gz' if compress else ''}"
@@ -1,8 +1,8 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, SubmitField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError, Length, Optional
-from models import User
+from wtforms import StringField, PasswordField, SubmitField, TextAreaField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional
+from registration import find_taken
 
 class RegistrationForm(FlaskForm):
     """User registration form"""
@@ -12,17 +12,20 @@ class RegistrationForm(FlaskForm):
     password2 = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password', message='Passwords must match')])
     submit = SubmitField('Register')
     
-    def validate_username(self, username):
-        """Check if username is already taken"""
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Username already taken. Please choose a different one.')
-    
-    def validate_email(self, email):
-        """Check if email is already registered"""
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email already registered. Please use a different one.')
+    def validate(self, extra_validators=None):
+        """Check username and email availability together in a single query
+
+        The check runs even when other fields fail, so every error is shown at once.
+        """
+        valid = super().validate(extra_validators)
+        if not (self.username.data and self.email.data):
+            return valid
+        username_taken, email_taken = find_taken(self.username.data, self.email.data)
+        if username_taken:
+            self.username.errors.append('Username already taken. Please choose a different one.')
+        if email_taken:
+            self.email.errors.append('Email already registered. Please use a different one.')
+        return valid and not (username_taken or email_taken)
 
 
 class LoginForm(FlaskForm):
@@ -37,6 +40,22 @@ class InvitationForm(FlaskForm):
     email = StringField('Email Address', validators=[DataRequired(), Email()])
     submit = SubmitField('Send Invitation')
 
+
+class BulkInvitationForm(FlaskForm):
+    """Form to invite many users to an account at once"""
+    emails = TextAreaField('Email Addresses', validators=[Optional()])
+    csv_file = FileField('CSV File', validators=[Optional(), FileAllowed(['csv', 'txt'], 'CSV files only!')])
+    submit = SubmitField('Send Invitations')
+    
+    def validate(self, extra_validators=None):
+        """Require either pasted addresses or a CSV file"""
+        if not super().validate(extra_validators):
+            return False
+        if not (self.emails.data or '').strip() and not self.csv_file.data:
+            self.emails.errors.append('Enter email addresses or upload a CSV file.')
+            return False
+        return True
+
     
 class ProfileForm(FlaskForm):
     """User profile editing form"""
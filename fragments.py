@@ -0,0 +1,170 @@
+import time
+import uuid
+from flask import current_app, has_app_context
+from markupsafe import Markup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+from werkzeug.local import LocalProxy
+from models import User, Account, AccountMember, Invitation
+from user_cache import MemoryBackend, RedisBackend
+
+
+# User columns shown in other users' fragments (member and invitation tables)
+SHARED_USER_FIELDS = ('username', 'email')
+
+
+def _dependencies(session, obj):
+    """Version keys affected by a change to a model instance"""
+    if isinstance(obj, User):
+        dependencies = [f'user:{obj.id}']
+        state = inspect(obj)
+        if obj in session.new:
+            return dependencies
+        if state.deleted or any(state.attrs[name].history.has_changes() for name in SHARED_USER_FIELDS):
+            account_ids = session.scalars(select(AccountMember.account_id).where(AccountMember.user_id == obj.id))
+            dependencies.extend(f'account:{account_id}' for account_id in account_ids)
+        return dependencies
+    if isinstance(obj, Account):
+        return [f'account:{obj.id}', f'user:{obj.owner_id}']
+    if isinstance(obj, AccountMember):
+        return [f'account:{obj.account_id}', f'user:{obj.user_id}']
+    if isinstance(obj, Invitation):
+        return [f'account:{obj.account_id}', f'invitee:{obj.invitee_email}']
+    return []
+
+
+def _row_dependencies(model, row):
+    """Version keys affected by a row inserted with a bulk INSERT"""
+    if model is Account:
+        return [f"user:{row.get('owner_id')}"]
+    if model is AccountMember:
+        return [f"account:{row.get('account_id')}", f"user:{row.get('user_id')}"]
+    if model is Invitation:
+        return [f"account:{row.get('account_id')}", f"invitee:{row.get('invitee_email')}"]
+    return []
+
+
+class FragmentCache:
+    """Cache for rendered template fragments keyed by model version tokens
+
+    Templates wrap expensive blocks in a call block:
+
+        {% call cached_fragment('account-members', accounts=[account.id]) %}
+            ...
+        {% endcall %}
+
+    The key combines the fragment name, any vary values and the current version
+    token of each user, account and invitee the block depends on. Changes to
+    User, Account, AccountMember and Invitation rows are collected when the
+    session flushes and the affected tokens are replaced once the transaction
+    commits, so later renders miss and rebuild the block. Renaming a user also
+    bumps the accounts they belong to, whose member tables show the name.
+    Version tokens are fetched with one multi-get per fragment. The memory
+    backend is per process; use the redis backend when running several workers.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('FRAGMENT_CACHE_BACKEND', 'null')
+        ttl = app.config.get('FRAGMENT_CACHE_TTL', 3600)
+        if backend == 'memory':
+            self.backend = MemoryBackend(max_size=app.config.get('FRAGMENT_CACHE_SIZE', 5000), ttl=ttl)
+        elif backend == 'redis':
+            self.backend = RedisBackend(app.config['FRAGMENT_CACHE_REDIS_URL'], ttl=ttl, prefix='fragment:')
+        elif backend is None or backend == 'null':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown FRAGMENT_CACHE_BACKEND: {backend}')
+        app.add_template_global(self.cached_fragment)
+        app.extensions['fragment_cache'] = self
+
+    def versions(self, dependencies):
+        """Current tokens for dependencies such as 'account:3', in one backend call"""
+        keys = [f'v:{dependency}' for dependency in dependencies]
+        missing = {}
+        tokens = []
+        for key, token in zip(keys, self.backend.get_many(keys)):
+            if token is None:
+                # A fresh token never matches fragments cached under an evicted one
+                token = missing.setdefault(key, self._new_token())
+            tokens.append(token)
+        if missing:
+            self.backend.set_many(missing)
+        return tokens
+
+    def bump(self, dependencies):
+        """Invalidate every fragment that depends on the given keys"""
+        if self.backend is None:
+            return
+        for dependency in dependencies:
+            self.backend.set(f'v:{dependency}', self._new_token())
+
+    def cached_fragment(self, name, users=(), accounts=(), invitees=(), vary=(), caller=None):
+        """Render the enclosed block, or return it from the cache"""
+        if self.backend is None:
+            return caller()
+        dependencies = ([f'user:{i}' for i in users] + [f'account:{i}' for i in accounts]
+                        + [f'invitee:{e}' for e in invitees])
+        parts = [name] + [str(value) for value in vary] + self.versions(dependencies)
+        key = 'f:' + '|'.join(parts)
+        html = self.backend.get(key)
+        if html is None:
+            html = str(caller())
+            self.backend.set(key, html)
+        return Markup(html)
+
+    @staticmethod
+    def _new_token():
+        return f'{time.time_ns():x}{uuid.uuid4().hex[:8]}'
+
+
+# The instance create_app made for the current app
+fragment_cache = LocalProxy(lambda: current_app.extensions['fragment_cache'])
+
+
+def _active_cache():
+    """The current app's fragment cache, or None when fragment caching is off"""
+    cache = current_app.extensions.get('fragment_cache') if has_app_context() else None
+    return cache if cache is not None and cache.backend is not None else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    """Remember which fragments the flushed changes affect"""
+    if _active_cache() is None:
+        return
+    dependencies = session.info.setdefault('fragment_dependencies', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        dependencies.update(_dependencies(session, obj))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_inserts(orm_execute_state):
+    """Bulk INSERTs bypass the flush, so collect their rows here"""
+    if _active_cache() is None or not orm_execute_state.is_insert:
+        return
+    mapper = orm_execute_state.bind_mapper
+    params = orm_execute_state.parameters
+    if mapper is None or not params:
+        return
+    rows = params if isinstance(params, list) else [params]
+    dependencies = orm_execute_state.session.info.setdefault('fragment_dependencies', set())
+    for row in rows:
+        dependencies.update(_row_dependencies(mapper.class_, row))
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed(session):
+    dependencies = session.info.pop('fragment_dependencies', ())
+    cache = _active_cache()
+    if cache is not None:
+        cache.bump(dependencies)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('fragment_dependencies', None)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import tempfile
+from flask import current_app
+from werkzeug.local import LocalProxy
+from werkzeug.utils import secure_filename
+from jobs import job_queue, job_task
+from models import db, User
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+
+def variant_filename(filename, size):
+    """Name of the WebP variant of an uploaded image at a given pixel size"""
+    return f"{os.path.splitext(filename)[0]}_{size}.webp"
+
+
+class ImagePipeline:
+    """Content-addressed storage for profile images with background thumbnails
+
+    Uploads are streamed to disk in chunks while being hashed, and stored as
+    <sha256>.<ext> so identical images share one file. Square WebP variants
+    for each size in PROFILE_IMAGE_SIZES are generated by image_variants jobs
+    and recorded on User.profile_image_variants once they exist.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.max_size = app.config['MAX_CONTENT_LENGTH']
+        self.sizes = app.config.get('PROFILE_IMAGE_SIZES', {})
+        app.extensions['image_pipeline'] = self
+
+    def save_upload(self, file):
+        """Stream an upload to disk and return its content-addressed filename"""
+        os.makedirs(self.upload_folder, exist_ok=True)
+        ext = os.path.splitext(secure_filename(file.filename))[1].lower()
+        digest = hashlib.sha256()
+        size = 0
+
+        fd, temp_path = tempfile.mkstemp(dir=self.upload_folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = file.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise ImageTooLarge()
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            filename = f"{digest.hexdigest()}{ext}"
+            path = os.path.join(self.upload_folder, filename)
+            if os.path.exists(path):
+                # Same content already stored, keep the existing file
+                os.remove(temp_path)
+            else:
+                os.replace(temp_path, path)
+            return filename
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def existing_variants(self, filename):
+        """Return the variants already on disk for an image, or None if any are missing"""
+        variants = {}
+        for name, size in self.sizes.items():
+            variant = variant_filename(filename, size)
+            if not os.path.exists(os.path.join(self.upload_folder, variant)):
+                return None
+            variants[name] = variant
+        return variants
+
+    def restore(self, file, filename):
+        """Make sure a committed upload is still on disk; True if variants must be regenerated
+
+        A discard_image job for an earlier copy of the same content may have
+        removed the shared file before the upload committed, so it is stored
+        again from the request.
+        """
+        if not os.path.exists(os.path.join(self.upload_folder, filename)):
+            file.stream.seek(0)
+            self.save_upload(file)
+        return self.existing_variants(filename) is None
+
+    def process(self, user_id, filename):
+        """Queue variant generation for a user's new image; the caller commits"""
+        job_queue.enqueue('image_variants', {'user_id': user_id, 'filename': filename})
+
+    def discard(self, filename):
+        """Queue deletion of an image that is no longer used; the caller commits"""
+        job_queue.enqueue('discard_image', {'filename': filename})
+
+    def _generate_variants(self, user_id, filename):
+        user = db.session.get(User, user_id)
+        # Skip if the user replaced the image before the job ran
+        if user is None or user.profile_image != filename:
+            return
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            self.app.logger.warning('Pillow is not installed, serving %s without variants', filename)
+            return
+
+        # Errors propagate so the job is retried
+        variants = {}
+        with Image.open(os.path.join(self.upload_folder, filename)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGBA')
+            for name, size in self.sizes.items():
+                variant = variant_filename(filename, size)
+                thumb = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+                thumb.save(os.path.join(self.upload_folder, variant), 'WEBP', quality=80)
+                variants[name] = variant
+
+        # Re-read the user, who may have replaced the image while we were working
+        db.session.rollback()
+        user = db.session.get(User, user_id)
+        if user is not None and user.profile_image == filename:
+            user.profile_image_variants = json.dumps(variants)
+            db.session.commit()
+
+    def _referenced(self, filename):
+        # Ends the current transaction so commits made since are visible
+        db.session.rollback()
+        return db.session.query(User.id).filter_by(profile_image=filename).first() is not None
+
+    def _remove_unreferenced(self, filename):
+        """Delete an image and its variants unless a user references them
+
+        The files are moved aside before the reference is checked again, and
+        put back if an upload of the same content committed in between. An
+        upload committing after that finds its file gone and stores it again
+        (see restore).
+        """
+        if self._referenced(filename):
+            return
+        moved = []
+        for name in [filename] + [variant_filename(filename, size) for size in self.sizes.values()]:
+            try:
+                os.replace(self._path(name), self._path(f'.discard-{name}'))
+            except OSError:
+                continue  # Already gone
+            moved.append(name)
+
+        in_use = self._referenced(filename)
+        for name in moved:
+            try:
+                if in_use:
+                    os.replace(self._path(f'.discard-{name}'), self._path(name))
+                else:
+                    os.remove(self._path(f'.discard-{name}'))
+            except OSError:
+                pass  # Ignore errors when deleting old images
+
+    def _path(self, name):
+        return os.path.join(self.upload_folder, name)
+
+
+# The instance create_app made for the current app
+image_pipeline = LocalProxy(lambda: current_app.extensions['image_pipeline'])
+
+
+@job_task('image_variants', concurrency=2)
+def generate_image_variants(payload):
+    """Generate the WebP variants of a user's new profile image"""
+    image_pipeline._generate_variants(payload['user_id'], payload['filename'])
+
+
+@job_task('discard_image', concurrency=2)
+def discard_image(payload):
+    """Delete a replaced profile image and its variants unless it is in use again"""
+    image_pipeline._remove_unreferenced(payload['filename'])
@@ -0,0 +1,210 @@
+import cProfile
+import hmac
+import ipaddress
+import os
+import random
+import threading
+import time
+from flask import g, request, abort, current_app, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.local import LocalProxy
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class EndpointStats:
+    """Accumulated cost of one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.wall_seconds = 0.0
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.over_budget = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class RequestProfiler:
+    """Opt-in per-endpoint timing, SQL and template instrumentation
+
+    Enabled with PROFILING_ENABLED. For every request it records wall time, SQL
+    query count and time (from engine events) and template render time, and
+    logs a warning when a request issues more than PROFILING_QUERY_BUDGET
+    queries. A PROFILING_CPROFILE_SAMPLE_RATE fraction of requests is run under
+    cProfile and dumped to PROFILING_DUMP_DIR. Totals are served in Prometheus
+    text format at PROFILING_METRICS_PATH to holders of PROFILING_METRICS_TOKEN
+    and to PROFILING_METRICS_ALLOWED_IPS. Metrics are per process.
+    """
+
+    def __init__(self, app=None):
+        self.stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('PROFILING_ENABLED'):
+            return
+        self.query_budget = app.config.get('PROFILING_QUERY_BUDGET', 20)
+        self.sample_rate = app.config.get('PROFILING_CPROFILE_SAMPLE_RATE', 0.0)
+        self.dump_dir = app.config.get('PROFILING_DUMP_DIR')
+        self.token = app.config.get('PROFILING_METRICS_TOKEN')
+        self.allowed_ips = set(app.config.get('PROFILING_METRICS_ALLOWED_IPS', ()))
+        if not app.config.get('PROXY_FIX_X_FOR'):
+            loopback = {ip for ip in self.allowed_ips if ipaddress.ip_address(ip).is_loopback}
+            if loopback:
+                app.logger.warning('Ignoring loopback PROFILING_METRICS_ALLOWED_IPS %s without PROXY_FIX_X_FOR',
+                                   sorted(loopback))
+                self.allowed_ips -= loopback
+
+        app.before_request(self._start)
+        app.after_request(self._add_headers)
+        app.teardown_request(self._finish)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(self._template_started, app)
+        template_rendered.connect(self._template_finished, app)
+        app.add_url_rule(app.config.get('PROFILING_METRICS_PATH', '/internal/metrics'),
+                         'metrics', self.metrics_view)
+        app.extensions['request_profiler'] = self
+
+    def _start(self):
+        g.profile = {'start': time.perf_counter(), 'sql_queries': 0, 'sql_seconds': 0.0,
+                     'template_seconds': 0.0, 'cprofile': None}
+        if self.sample_rate and random.random() < self.sample_rate:
+            g.profile['cprofile'] = cProfile.Profile()
+            g.profile['cprofile'].enable()
+
+    def _add_headers(self, response):
+        profile = g.get('profile')
+        if profile is not None and current_app.debug:
+            response.headers['X-Query-Count'] = str(profile['sql_queries'])
+        return response
+
+    def _finish(self, exc=None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        elapsed = time.perf_counter() - profile['start']
+        endpoint = request.endpoint or 'unmatched'
+
+        if profile['cprofile'] is not None:
+            profile['cprofile'].disable()
+            self._dump(profile['cprofile'], endpoint)
+
+        over_budget = profile['sql_queries'] > self.query_budget
+        if over_budget:
+            current_app.logger.warning('%s issued %d SQL queries (budget %d) for %s',
+                                       endpoint, profile['sql_queries'], self.query_budget, request.path)
+
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.wall_seconds += elapsed
+            stats.sql_queries += profile['sql_queries']
+            stats.sql_seconds += profile['sql_seconds']
+            stats.template_seconds += profile['template_seconds']
+            stats.over_budget += over_budget
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    stats.buckets[index] += 1
+
+    def _dump(self, profiler, endpoint):
+        if not self.dump_dir:
+            return
+        os.makedirs(self.dump_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.dump_dir, f'{endpoint}-{time.time():.6f}.prof'))
+
+    def _template_started(self, sender, template, context, **extra):
+        profile = g.get('profile')
+        if profile is not None:
+            profile.setdefault('template_starts', []).append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        profile = g.get('profile')
+        if profile is not None and profile.get('template_starts'):
+            profile['template_seconds'] += time.perf_counter() - profile['template_starts'].pop()
+
+    def metrics_view(self):
+        """Serve collected metrics in Prometheus text format"""
+        if not self._metrics_allowed():
+            abort(404)
+        return self.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    def _metrics_allowed(self):
+        if self.token:
+            scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+            if scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), self.token.encode()):
+                return True
+        return request.remote_addr in self.allowed_ips
+
+    def render_metrics(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        with self._lock:
+            stats = sorted(self.stats.items())
+            lines.append('# HELP app_request_duration_seconds Wall time spent handling requests')
+            lines.append('# TYPE app_request_duration_seconds histogram')
+            for endpoint, s in stats:
+                for bound, count in zip(DURATION_BUCKETS, s.buckets):
+                    lines.append(f'app_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                lines.append(f'app_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {s.requests}')
+                lines.append(f'app_request_duration_seconds_sum{{endpoint="{endpoint}"}} {s.wall_seconds}')
+                lines.append(f'app_request_duration_seconds_count{{endpoint="{endpoint}"}} {s.requests}')
+            metric('app_sql_queries_total', 'counter', 'SQL statements executed',
+                   [({'endpoint': e}, s.sql_queries) for e, s in stats])
+            metric('app_sql_seconds_total', 'counter', 'Time spent executing SQL',
+                   [({'endpoint': e}, s.sql_seconds) for e, s in stats])
+            metric('app_template_seconds_total', 'counter', 'Time spent rendering templates',
+                   [({'endpoint': e}, s.template_seconds) for e, s in stats])
+            metric('app_query_budget_exceeded_total', 'counter', 'Requests over the SQL query budget',
+                   [({'endpoint': e}, s.over_budget) for e, s in stats])
+
+        # Counters kept by other components
+        user_cache = current_app.extensions.get('user_cache')
+        if user_cache is not None:
+            metric('app_user_cache_total', 'counter', 'User loader cache lookups',
+                   [({'result': name}, value) for name, value in user_cache.stats().items()])
+        password_hasher = current_app.extensions.get('password_hasher')
+        if password_hasher is not None:
+            hasher_stats = sorted(password_hasher.stats().items())
+            metric('app_password_hash_calls_total', 'counter', 'Password hash operations',
+                   [({'operation': op}, s['count']) for op, s in hasher_stats])
+            metric('app_password_hash_seconds_total', 'counter', 'Time spent hashing passwords',
+                   [({'operation': op}, s['total_seconds']) for op, s in hasher_stats])
+        admission_control = current_app.extensions.get('admission_control')
+        if admission_control is not None:
+            metric('app_requests_rejected_total', 'counter', 'Requests rejected by rate limits or concurrency caps',
+                   [({'endpoint': e, 'reason': r}, n) for (e, r), n in sorted(admission_control.stats().items())])
+        return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    # Only statements issued from a request thread are attributed to it
+    profile = g.get('profile') if has_request_context() else None
+    if profile is not None:
+        profile['sql_queries'] += 1
+        profile['sql_seconds'] += elapsed
+
+
+# The instance create_app made for the current app
+request_profiler = LocalProxy(lambda: current_app.extensions['request_profiler'])
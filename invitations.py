@@ -0,0 +1,159 @@
+import csv
+import io
+import re
+from email_validator import validate_email, EmailNotValidError
+from flask import current_app, render_template
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from jobs import job_queue, job_task
+from mail import mailer
+from models import db, User, AccountMember, Invitation
+
+# Outcomes reported for each email passed to invite_emails
+INVITED = 'invited'
+ALREADY_MEMBER = 'already_member'
+ALREADY_INVITED = 'already_invited'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+
+# Stay well below SQLite's bound parameter limit
+IN_BATCH_SIZE = 500
+
+
+def _batches(items, size=IN_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def parse_emails(text='', csv_file=None):
+    """Collect email addresses from free text and/or an uploaded CSV file
+
+    Text may separate addresses with commas, semicolons or whitespace. For CSV
+    files every cell containing an @ is treated as an address, so header rows
+    and extra columns such as names are ignored.
+    """
+    emails = [e for e in re.split(r'[\s,;]+', text or '') if e]
+    if csv_file is not None:
+        content = csv_file.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig', errors='replace')
+        for row in csv.reader(io.StringIO(content)):
+            emails.extend(cell.strip() for cell in row if '@' in cell)
+    return emails
+
+
+def invite_emails(account_id, inviter_id, emails):
+    """Invite many emails to an account with set-based checks and one insert
+
+    Existing users, memberships and pending invitations are resolved with
+    batched IN (...) queries, then all new invitations are inserted in a single
+    executemany and committed once, together with an invitation_email job for
+    each. Returns a list of (email, outcome) pairs in input order.
+    """
+    outcomes = []
+    candidates = []
+    seen = set()
+    for raw in emails:
+        email = raw.strip()
+        if email in seen:
+            outcomes.append((email, DUPLICATE))
+            continue
+        seen.add(email)
+        try:
+            validate_email(email, check_deliverability=False)
+        except EmailNotValidError:
+            outcomes.append((email, INVALID))
+            continue
+        outcomes.append((email, None))
+        candidates.append(email)
+
+    user_ids = {}
+    invited = set()
+    for batch in _batches(candidates):
+        user_ids.update(db.session.query(User.email, User.id).filter(User.email.in_(batch)).all())
+        invited.update(email for (email,) in db.session.query(Invitation.invitee_email).filter(
+            Invitation.account_id == account_id,
+            Invitation.status == 'pending',
+            Invitation.invitee_email.in_(batch)
+        ))
+
+    member_ids = set()
+    for batch in _batches(list(user_ids.values())):
+        member_ids.update(user_id for (user_id,) in db.session.query(AccountMember.user_id).filter(
+            AccountMember.account_id == account_id,
+            AccountMember.user_id.in_(batch)
+        ))
+
+    new_rows = []
+    for index, (email, outcome) in enumerate(outcomes):
+        if outcome is not None:
+            continue
+        if user_ids.get(email) in member_ids:
+            outcome = ALREADY_MEMBER
+        elif email in invited:
+            outcome = ALREADY_INVITED
+        else:
+            outcome = INVITED
+            new_rows.append({'account_id': account_id, 'inviter_id': inviter_id, 'invitee_email': email})
+        outcomes[index] = (email, outcome)
+
+    if new_rows:
+        try:
+            db.session.execute(insert(Invitation), new_rows)
+            _queue_emails(new_rows)
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request invited some of these emails first; the
+            # partial unique index on pending invitations rejected the batch
+            db.session.rollback()
+            _insert_individually(new_rows, outcomes)
+    return outcomes
+
+
+def _insert_individually(rows, outcomes):
+    """Insert invitations one savepoint at a time, marking conflicts as already invited"""
+    conflicts = set()
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Invitation), [row])
+        except IntegrityError:
+            conflicts.add(row['invitee_email'])
+    _queue_emails([row for row in rows if row['invitee_email'] not in conflicts])
+    db.session.commit()
+    for index, (email, outcome) in enumerate(outcomes):
+        if outcome == INVITED and email in conflicts:
+            outcomes[index] = (email, ALREADY_INVITED)
+
+
+def _queue_emails(rows):
+    job_queue.enqueue_many('invitation_email', [
+        {'account_id': row['account_id'], 'invitee_email': row['invitee_email']} for row in rows
+    ])
+
+
+@job_task('invitation_email', batch_size=50, concurrency=4)
+def send_invitation_emails(payloads):
+    """Email invitees about their invitations, one mail transport session per batch
+
+    Invitations accepted or declined before the job runs are skipped.
+    """
+    keys = {(p['account_id'], p['invitee_email']) for p in payloads}
+    invitations = Invitation.query.options(
+        joinedload(Invitation.account), joinedload(Invitation.inviter)
+    ).filter(
+        Invitation.status == 'pending',
+        Invitation.account_id.in_({account_id for account_id, _ in keys}),
+        Invitation.invitee_email.in_({email for _, email in keys})
+    ).all()
+    base_url = current_app.config['APP_BASE_URL'].rstrip('/')
+    mailer.send_many([
+        mailer.message(
+            invitation.invitee_email,
+            f'{invitation.inviter.display_name or invitation.inviter.username} invited you to {invitation.account.name}',
+            render_template('email/invitation.txt', invitation=invitation, base_url=base_url)
+        )
+        for invitation in invitations
+        if (invitation.account_id, invitation.invitee_email) in keys
+    ])
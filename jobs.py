@@ -0,0 +1,291 @@
+import itertools
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, select, update, delete, func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import aliased
+from werkzeug.local import LocalProxy
+from models import db, Job
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Seconds between stale-lock and recurring-job checks in a worker
+MAINTENANCE_INTERVAL = 60
+
+
+class Task:
+    """Handler and limits registered for a job kind"""
+
+    def __init__(self, kind, handler, batch_size=1, concurrency=None, max_attempts=None):
+        self.kind = kind
+        self.handler = handler
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+
+# Handlers registered with @job_task, shared by the queue of every app
+TASKS = {}
+
+
+def job_task(kind, batch_size=1, concurrency=None, max_attempts=None):
+    """Register the decorated function as the handler for a job kind"""
+    def decorator(handler):
+        TASKS[kind] = Task(kind, handler, batch_size, concurrency, max_attempts)
+        return handler
+    return decorator
+
+
+class JobQueue:
+    """Durable queue of deferred work stored in the job table
+
+    enqueue() adds jobs to the current session, so they are queued only if the
+    caller's transaction commits. Handlers are registered per kind with
+    @job_task(kind, batch_size=..., concurrency=...); kinds with a
+    batch_size above 1 get a list of up to that many payloads, the others a
+    single payload. `flask jobs work` claims due jobs, runs them in a thread
+    pool and retries failures with exponential backoff until max_attempts.
+    concurrency caps the batches of a kind running at once across all
+    workers, and kinds in JOB_SCHEDULE are re-queued every interval. Workers
+    refresh the lock of running jobs, so only jobs of a worker that stopped
+    are requeued after JOB_LOCK_TIMEOUT. Delivery is at least once: a failed
+    batch is retried as a whole and jobs of a crashed worker run again, so
+    handlers must tolerate running twice.
+    """
+
+    def __init__(self, app=None):
+        self.tasks = TASKS
+        self._stopping = threading.Event()
+        self._claims = itertools.count(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.backoff_base = app.config.get('JOB_BACKOFF_BASE', 10)
+        self.backoff_max = app.config.get('JOB_BACKOFF_MAX', 3600)
+        self.lock_timeout = app.config.get('JOB_LOCK_TIMEOUT', 600)
+        self.concurrency = app.config.get('JOB_CONCURRENCY', {})
+        self.schedule = app.config.get('JOB_SCHEDULE', {})
+        app.extensions['job_queue'] = self
+
+    def enqueue(self, kind, payload=None, delay=0, unique_key=None):
+        """Add a job to the current session; it is queued when the caller commits
+
+        A job with a unique_key is skipped while another queued or running job
+        has the same key. Returns whether the job was added.
+        """
+        if unique_key is None:
+            self.enqueue_many(kind, [payload or {}], delay=delay)
+            return True
+        row = self._row(kind, payload or {}, delay)
+        row['unique_key'] = unique_key
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(Job), [row])
+        except IntegrityError:
+            return False
+        return True
+
+    def enqueue_many(self, kind, payloads, delay=0):
+        """Add many jobs of one kind with a single executemany"""
+        if not payloads:
+            return
+        db.session.execute(insert(Job), [self._row(kind, payload, delay) for payload in payloads])
+
+    def _row(self, kind, payload, delay):
+        return {'kind': kind, 'payload': json.dumps(payload), 'status': QUEUED, 'attempts': 0,
+                'max_attempts': self.max_attempts, 'run_at': datetime.utcnow() + timedelta(seconds=delay)}
+
+    def work(self, kinds=None, threads=4, once=False, poll_interval=1.0):
+        """Run jobs until stop() is called, or with once until none are due
+
+        Must be called inside an app context. Returns the number of jobs run.
+        """
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        tasks = [self.tasks[kind] for kind in (kinds or self.tasks)]
+        self._stopping.clear()
+        in_flight = {}
+        processed = 0
+        last_maintenance = last_heartbeat = time.monotonic() - MAINTENANCE_INTERVAL
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='jobs') as executor:
+            while not self._stopping.is_set():
+                if time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                    self.requeue_stale()
+                    self._schedule_recurring(tasks)
+                    last_maintenance = time.monotonic()
+                if in_flight and time.monotonic() - last_heartbeat >= self.lock_timeout / 4:
+                    self._heartbeat(list(in_flight.values()))
+                    last_heartbeat = time.monotonic()
+
+                claimed = False
+                for task in tasks:
+                    while len(in_flight) < threads:
+                        claim, jobs = self._claim(task, worker_id)
+                        if not jobs:
+                            break
+                        claimed = True
+                        processed += len(jobs)
+                        in_flight[executor.submit(self._run, task, claim, jobs)] = claim
+
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                elif once and not claimed:
+                    break
+                else:
+                    self._stopping.wait(poll_interval)
+        return processed
+
+    def stop(self):
+        """Ask a running worker to finish its current jobs and return"""
+        self._stopping.set()
+
+    def requeue_stale(self):
+        """Requeue jobs whose worker stopped updating them within JOB_LOCK_TIMEOUT"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lock_timeout)
+        stale = (Job.status == RUNNING) & (Job.locked_at < cutoff)
+        db.session.execute(update(Job).where(stale, Job.attempts >= Job.max_attempts).values(
+            status=FAILED, locked_by=None, finished_at=datetime.utcnow(), last_error='Worker lock expired'
+        ).execution_options(synchronize_session=False))
+        result = db.session.execute(update(Job).where(stale).values(
+            status=QUEUED, locked_by=None, locked_at=None
+        ).execution_options(synchronize_session=False))
+        db.session.commit()
+        return result.rowcount
+
+    def retry_failed(self, kind=None):
+        """Queue failed jobs again with a fresh set of attempts"""
+        criteria = [Job.status == FAILED] + ([Job.kind == kind] if kind else [])
+        # Dropping the unique key avoids clashing with a newer run already queued
+        result = db.session.execute(update(Job).where(*criteria).values(
+            status=QUEUED, attempts=0, run_at=datetime.utcnow(), finished_at=None, unique_key=None
+        ).execution_options(synchronize_session=False))
+        db.session.commit()
+        return result.rowcount
+
+    def purge(self, days=7):
+        """Delete finished jobs older than a number of days"""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        result = db.session.execute(delete(Job).where(Job.status.in_((DONE, FAILED)), Job.finished_at < cutoff))
+        db.session.commit()
+        return result.rowcount
+
+    def stats(self):
+        """Job counts as {kind: {status: count}}"""
+        counts = {}
+        for kind, status, count in db.session.query(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status):
+            counts.setdefault(kind, {})[status] = count
+        return counts
+
+    def _claim(self, task, worker_id):
+        """Mark up to one batch of due jobs of a kind as running under a new claim id
+
+        Picking the batch, checking the kind's concurrency limit and marking the
+        rows happen in one UPDATE, so concurrent workers can neither claim the
+        same job nor together exceed the limit. SQLite runs the statement under
+        its write lock; PostgreSQL skips rows locked by other claims and
+        serializes claims of a limited kind with an advisory lock.
+        """
+        now = datetime.utcnow()
+        claim = f'{worker_id}:{next(self._claims)}'
+        postgresql = db.engine.dialect.name == 'postgresql'
+        due = aliased(Job)
+        batch = select(due.id).where(due.kind == task.kind, due.status == QUEUED, due.run_at <= now).order_by(
+            due.run_at, due.id).limit(task.batch_size)
+        if postgresql:
+            batch = batch.with_for_update(skip_locked=True)
+        criteria = [Job.id.in_(batch), Job.status == QUEUED]
+        concurrency = self.concurrency.get(task.kind, task.concurrency)
+        if concurrency:
+            if postgresql:
+                db.session.execute(select(func.pg_advisory_xact_lock(zlib.crc32(task.kind.encode('utf-8')))))
+            running = aliased(Job)
+            claims = select(func.count(func.distinct(running.locked_by))).where(
+                running.kind == task.kind, running.status == RUNNING).scalar_subquery()
+            criteria.append(claims < concurrency)
+        result = db.session.execute(update(Job).where(*criteria).values(
+            status=RUNNING, locked_by=claim, locked_at=now, attempts=Job.attempts + 1
+        ).execution_options(synchronize_session=False))
+        if not result.rowcount:
+            db.session.rollback()
+            return claim, []
+        jobs = db.session.execute(select(Job.id, Job.payload, Job.attempts, Job.max_attempts).where(
+            Job.locked_by == claim).order_by(Job.run_at, Job.id)).all()
+        db.session.commit()
+        return claim, jobs
+
+    def _heartbeat(self, claims):
+        """Refresh the lock of running claims so requeue_stale leaves them alone"""
+        try:
+            db.session.execute(update(Job).where(Job.locked_by.in_(claims), Job.status == RUNNING).values(
+                locked_at=datetime.utcnow()).execution_options(synchronize_session=False))
+            db.session.commit()
+        except SQLAlchemyError:
+            # Retried on the next pass; the lock timeout leaves plenty of slack
+            db.session.rollback()
+            self.app.logger.warning('Could not refresh job locks', exc_info=True)
+
+    def _run(self, task, claim, jobs):
+        with self.app.app_context():
+            payloads = [json.loads(job.payload) for job in jobs]
+            try:
+                task.handler(payloads if task.batch_size > 1 else payloads[0])
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('%s job(s) %s failed', task.kind, [job.id for job in jobs])
+                self._fail(task, claim, jobs, traceback.format_exc())
+            else:
+                # Only rows still held by this claim; a requeued job belongs to someone else
+                db.session.execute(update(Job).where(Job.locked_by == claim, Job.status == RUNNING).values(
+                    status=DONE, locked_by=None, finished_at=datetime.utcnow()
+                ).execution_options(synchronize_session=False))
+                db.session.commit()
+
+    def _fail(self, task, claim, jobs, error):
+        now = datetime.utcnow()
+        for job in jobs:
+            if job.attempts >= (task.max_attempts or job.max_attempts):
+                values = {'status': FAILED, 'finished_at': now}
+            else:
+                values = {'status': QUEUED, 'run_at': now + timedelta(seconds=self._backoff(job.attempts))}
+            db.session.execute(update(Job).where(Job.id == job.id, Job.locked_by == claim).values(
+                locked_by=None, last_error=error, **values).execution_options(synchronize_session=False))
+        db.session.commit()
+
+    def _backoff(self, attempts):
+        """Exponential backoff with jitter so failed batches do not retry in lockstep"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _schedule_recurring(self, tasks):
+        """Queue the next run of each JOB_SCHEDULE kind this worker handles"""
+        for task in tasks:
+            interval = self.schedule.get(task.kind)
+            if not interval:
+                continue
+            last_run = db.session.scalar(select(func.max(Job.finished_at)).where(Job.kind == task.kind))
+            delay = 0
+            if last_run is not None:
+                delay = max(0, (last_run + timedelta(seconds=interval) - datetime.utcnow()).total_seconds())
+            # The unique key keeps workers from queueing the same run twice
+            self.enqueue(task.kind, delay=delay, unique_key=f'schedule:{task.kind}')
+        db.session.commit()
+
+
+# The instance create_app made for the current app
+job_queue = LocalProxy(lambda: current_app.extensions['job_queue'])
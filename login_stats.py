@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from jobs import job_task
+from models import db, LoginHistory, LoginDailyStat
+
+
+def _upsert_insert(dialect):
+    """The dialect's insert() construct, which supports ON CONFLICT"""
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert
+
+
+def _upsert_stat(user_id, day, amount):
+    """Add amount to a user's rollup row for a day, creating it if needed"""
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = _upsert_insert(dialect)(LoginDailyStat).values(user_id=user_id, day=day, login_count=amount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={'login_count': LoginDailyStat.login_count + amount}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback for databases without ON CONFLICT support
+    updated = LoginDailyStat.query.filter_by(user_id=user_id, day=day).update(
+        {LoginDailyStat.login_count: LoginDailyStat.login_count + amount},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(LoginDailyStat(user_id=user_id, day=day, login_count=amount))
+
+
+def increment_login_stat(user_id, day, amount=1):
+    """Increment the rollup for a login; the caller commits"""
+    _upsert_stat(user_id, day, amount)
+
+
+def get_login_count(user_id, days=30):
+    """Get number of logins in the last X days by summing at most X rollup rows"""
+    first_day = (datetime.utcnow() - timedelta(days=days)).date() + timedelta(days=1)
+    return db.session.query(func.coalesce(func.sum(LoginDailyStat.login_count), 0)).filter(
+        LoginDailyStat.user_id == user_id,
+        LoginDailyStat.day >= first_day
+    ).scalar()
+
+
+# Days of raw login history folded into the rollups per transaction
+COMPACT_BATCH_DAYS = 7
+
+
+def _set_stats(start, end):
+    """Overwrite rollups for [start, end) with counts recomputed from raw history
+
+    Returns the number of rollup rows written. SQLite and PostgreSQL do this in one INSERT ... SELECT ... GROUP BY with
+    ON CONFLICT DO UPDATE; other databases fall back to a row per user and day.
+    """
+    day = func.date(LoginHistory.login_time)
+    counts = db.session.query(LoginHistory.user_id, day, func.count(LoginHistory.id)).filter(
+        LoginHistory.login_time >= start,
+        LoginHistory.login_time < end
+    ).group_by(LoginHistory.user_id, day)
+
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = _upsert_insert(dialect)(LoginDailyStat).from_select(
+            ['user_id', 'day', 'login_count'], counts.statement)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'day'],
+            set_={'login_count': stmt.excluded.login_count}
+        )
+        return db.session.execute(stmt).rowcount
+
+    rows = counts.all()
+    for user_id, day, count in rows:
+        if isinstance(day, str):
+            day = datetime.strptime(day, '%Y-%m-%d').date()
+        stat = LoginDailyStat.query.filter_by(user_id=user_id, day=day).first()
+        if stat:
+            stat.login_count = count
+        else:
+            db.session.add(LoginDailyStat(user_id=user_id, day=day, login_count=count))
+    return len(rows)
+
+
+def _day_batches(after=None, before=None, days=COMPACT_BATCH_DAYS):
+    """Yield midnight-aligned [start, end) ranges covering raw history, skipping empty stretches"""
+    while True:
+        query = db.session.query(func.min(LoginHistory.login_time))
+        if after is not None:
+            query = query.filter(LoginHistory.login_time >= after)
+        if before is not None:
+            query = query.filter(LoginHistory.login_time < before)
+        first = query.scalar()
+        if first is None:
+            return
+        if isinstance(first, str):
+            first = datetime.fromisoformat(first)
+        start = datetime.combine(first.date(), datetime.min.time())
+        end = start + timedelta(days=days)
+        if before is not None:
+            end = min(end, before)
+        yield start, end
+        after = end
+
+
+def rebuild_login_stats():
+    """Recompute rollups for every day that still has raw login history
+
+    Works through the history a week at a time, committing after each batch.
+    Returns the number of rollup rows written.
+    """
+    rebuilt = 0
+    for start, end in _day_batches():
+        rebuilt += _set_stats(start, end)
+        db.session.commit()
+    return rebuilt
+
+
+def compact_login_history(days=90):
+    """Fold raw login history older than X days into the rollups and delete it
+
+    The cutoff is aligned to midnight so whole days are compacted at once, which
+    keeps the recomputed rollup counts exact. Each week of history is folded and
+    deleted in its own transaction, so the write lock is only held briefly and
+    an interrupted run can simply be started again.
+    """
+    cutoff = datetime.combine((datetime.utcnow() - timedelta(days=days)).date(), datetime.min.time())
+    deleted = 0
+    for start, end in _day_batches(before=cutoff):
+        _set_stats(start, end)
+        deleted += LoginHistory.query.filter(
+            LoginHistory.login_time >= start,
+            LoginHistory.login_time < end
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    return deleted
+
+
+@job_task('compact_logins', concurrency=1)
+def compact_logins_job(payload):
+    """Run compact_login_history from the worker (queued daily by JOB_SCHEDULE)"""
+    compact_login_history(days=payload.get('days') or current_app.config['LOGIN_HISTORY_RETENTION_DAYS'])
@@ -0,0 +1,137 @@
+import atexit
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert
+from models import db, LoginHistory
+from login_stats import increment_login_stat
+
+_STOP = object()
+
+
+class LoginEventWriter:
+    """Write-behind buffer for login events
+
+    Logins are queued in-process and a background thread bulk-inserts them in
+    batches, flushing when LOGIN_WRITE_BATCH_SIZE events are pending or
+    LOGIN_WRITE_FLUSH_INTERVAL seconds have passed since the first one. Only
+    active when LOGIN_WRITE_BEHIND is enabled; otherwise record_login keeps
+    committing synchronously.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register the writer on the app if write-behind is enabled"""
+        if not app.config.get('LOGIN_WRITE_BEHIND'):
+            return
+        self.app = app
+        self.batch_size = app.config.get('LOGIN_WRITE_BATCH_SIZE', 500)
+        self.flush_interval = app.config.get('LOGIN_WRITE_FLUSH_INTERVAL', 1.0)
+        self._queue = queue.Queue(maxsize=app.config.get('LOGIN_WRITE_QUEUE_SIZE', 10000))
+        app.extensions['login_writer'] = self
+        atexit.register(self.close)
+
+    def submit(self, user_id, login_time=None):
+        """Queue a login event, writing it inline if the buffer is full"""
+        event = (user_id, login_time or datetime.utcnow())
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Apply backpressure rather than growing without bound
+            self._write([event])
+
+    def flush(self, timeout=None):
+        """Block until every event queued so far has been written"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Stop the background thread after writing any pending events"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        """Start the background thread on first use so it survives pre-fork servers"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='login-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        started = None
+        while True:
+            if batch:
+                timeout = max(self.flush_interval - (time.monotonic() - started), 0)
+            else:
+                timeout = None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._drain(batch)
+                return
+            if isinstance(item, threading.Event):
+                self._drain(batch)
+                batch = []
+                item.set()
+                continue
+            if item is not None:
+                if not batch:
+                    started = time.monotonic()
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() - started >= self.flush_interval):
+                self._write(batch)
+                batch = []
+
+    def _drain(self, batch):
+        """Write the current batch plus anything still queued"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._write(batch)
+
+    def _write(self, events):
+        """Bulk insert login events and update the daily rollups in one transaction"""
+        with self.app.app_context():
+            try:
+                db.session.execute(
+                    insert(LoginHistory),
+                    [{'user_id': user_id, 'login_time': login_time} for user_id, login_time in events]
+                )
+                daily = Counter((user_id, login_time.date()) for user_id, login_time in events)
+                for (user_id, day), count in daily.items():
+                    increment_login_stat(user_id, day, count)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Failed to write %d login events', len(events))
@@ -0,0 +1,103 @@
+import importlib
+import logging
+import smtplib
+import threading
+from email.message import EmailMessage
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+logger = logging.getLogger(__name__)
+
+
+class ConsoleTransport:
+    """Log messages instead of sending them (development stand-in)"""
+
+    def __init__(self, config):
+        pass
+
+    def send_many(self, messages):
+        for message in messages:
+            logger.info('Mail to %s: %s\n%s', message['To'], message['Subject'], message.get_content())
+
+
+class MemoryTransport:
+    """Keep sent messages in an outbox list (tests)"""
+
+    def __init__(self, config):
+        self.outbox = []
+        self._lock = threading.Lock()
+
+    def send_many(self, messages):
+        with self._lock:
+            self.outbox.extend(messages)
+
+
+class SMTPTransport:
+    """Send through an SMTP server, one connection per batch
+
+    Point MAIL_SERVER/MAIL_PORT at a local debugging server (for example
+    `python -m aiosmtpd -n -l localhost:1025`) to inspect messages in
+    development.
+    """
+
+    def __init__(self, config):
+        self.host = config.get('MAIL_SERVER', 'localhost')
+        self.port = config.get('MAIL_PORT', 25)
+        self.use_tls = config.get('MAIL_USE_TLS', False)
+        self.username = config.get('MAIL_USERNAME')
+        self.password = config.get('MAIL_PASSWORD')
+        self.timeout = config.get('MAIL_TIMEOUT', 10)
+
+    def send_many(self, messages):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for message in messages:
+                smtp.send_message(message)
+
+
+TRANSPORTS = {'console': ConsoleTransport, 'memory': MemoryTransport, 'smtp': SMTPTransport}
+
+
+class Mailer:
+    """Build messages and hand them to the configured MAIL_TRANSPORT
+
+    MAIL_TRANSPORT is 'console', 'memory', 'smtp' or a 'module:Class' path to
+    a class taking the app config with a send_many(messages) method.
+    """
+
+    def __init__(self, app=None):
+        self.transport = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('MAIL_TRANSPORT', 'console')
+        if name in TRANSPORTS:
+            transport_class = TRANSPORTS[name]
+        elif ':' in name:
+            module, _, attr = name.partition(':')
+            transport_class = getattr(importlib.import_module(module), attr)
+        else:
+            raise ValueError(f'Unknown MAIL_TRANSPORT: {name}')
+        self.transport = transport_class(app.config)
+        self.sender = app.config.get('MAIL_DEFAULT_SENDER', 'no-reply@localhost')
+        app.extensions['mailer'] = self
+
+    def message(self, to, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = to
+        message['Subject'] = subject
+        message.set_content(body)
+        return message
+
+    def send_many(self, messages):
+        if messages:
+            self.transport.send_many(messages)
+
+
+# The instance create_app made for the current app
+mailer = LocalProxy(lambda: current_app.extensions['mailer'])
@@ -0,0 +1,38 @@
+"""add profile fields
+
+Revision ID: 8b4e61f0c2d7
+Revises: 3f1c2a9d8e41
+Create Date: 2026-10-17 09:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e61f0c2d7'
+down_revision = '3f1c2a9d8e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('first_name', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('last_name', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('display_name', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('city', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('state', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('country', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('profile_image', sa.String(length=200), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('profile_image')
+        batch_op.drop_column('country')
+        batch_op.drop_column('state')
+        batch_op.drop_column('city')
+        batch_op.drop_column('display_name')
+        batch_op.drop_column('last_name')
+        batch_op.drop_column('first_name')
@@ -0,0 +1,61 @@
+"""login rollups, image variants and listing indexes
+
+Revision ID: c5a9d3e7f102
+Revises: 8b4e61f0c2d7
+Create Date: 2026-10-17 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a9d3e7f102'
+down_revision = '8b4e61f0c2d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_daily_stat',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('login_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'day', name='unique_login_daily_stat')
+    )
+    # Dashboards read only the rollups, so fill them from the existing history
+    op.execute(
+        'INSERT INTO login_daily_stat (user_id, day, login_count) '
+        'SELECT user_id, DATE(login_time), COUNT(id) FROM login_history '
+        'GROUP BY user_id, DATE(login_time)'
+    )
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_image_variants', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('login_history', schema=None) as batch_op:
+        batch_op.create_index('ix_login_history_user_time', ['user_id', 'login_time'], unique=False)
+
+    with op.batch_alter_table('account_member', schema=None) as batch_op:
+        batch_op.create_index('ix_account_member_account_joined', ['account_id', 'joined_at', 'id'], unique=False)
+
+    with op.batch_alter_table('invitation', schema=None) as batch_op:
+        batch_op.create_index('ix_invitation_account_status_created', ['account_id', 'status', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('invitation', schema=None) as batch_op:
+        batch_op.drop_index('ix_invitation_account_status_created')
+
+    with op.batch_alter_table('account_member', schema=None) as batch_op:
+        batch_op.drop_index('ix_account_member_account_joined')
+
+    with op.batch_alter_table('login_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_login_history_user_time')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('profile_image_variants')
+
+    op.drop_table('login_daily_stat')
@@ -0,0 +1,30 @@
+"""job unique key for deduplicated recurring jobs
+
+Revision ID: c8f1d4b2e7a5
+Revises: a4d8e2f6c913
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f1d4b2e7a5'
+down_revision = 'a4d8e2f6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unique_key', sa.String(length=100), nullable=True))
+        batch_op.create_index('uq_job_unique_key_pending', ['unique_key'], unique=True,
+                              sqlite_where=sa.text("status IN ('queued', 'running')"),
+                              postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade():
+    with op.batch_alter_table('job', schema=None) as batch_op:
+        batch_op.drop_index('uq_job_unique_key_pending')
+        batch_op.drop_column('unique_key')
@@ -0,0 +1,43 @@
+"""invitation lookup indexes and pending uniqueness
+
+Revision ID: e21f7b6a4c90
+Revises: c5a9d3e7f102
+Create Date: 2026-10-17 09:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e21f7b6a4c90'
+down_revision = 'c5a9d3e7f102'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the oldest pending invitation per account and email so the
+    # unique index below can be built on data written by the old check-then-insert
+    op.execute("""
+        UPDATE invitation SET status = 'declined'
+        WHERE status = 'pending' AND id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM invitation
+                WHERE status = 'pending'
+                GROUP BY account_id, invitee_email
+            ) AS oldest
+        )
+    """)
+
+    with op.batch_alter_table('invitation', schema=None) as batch_op:
+        batch_op.create_index('ix_invitation_invitee_status', ['invitee_email', 'status'], unique=False)
+        batch_op.create_index('uq_invitation_pending', ['account_id', 'invitee_email'], unique=True,
+                              sqlite_where=sa.text("status = 'pending'"),
+                              postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    with op.batch_alter_table('invitation', schema=None) as batch_op:
+        batch_op.drop_index('uq_invitation_pending')
+        batch_op.drop_index('ix_invitation_invitee_status')
@@ -1,9 +1,12 @@
+import json
 from datetime import datetime
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import password_hasher
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     """User account model"""
@@ -21,33 +24,53 @@ class User(UserMixin, db.Model):
     state = db.Column(db.String(100))
     country = db.Column(db.String(100))
     profile_image = db.Column(db.String(200))
+    profile_image_variants = db.Column(db.Text)  # JSON map of size name to WebP filename
         
     # Relationships
     login_history = db.relationship('LoginHistory', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    login_stats = db.relationship('LoginDailyStat', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     owned_accounts = db.relationship('Account', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
     memberships = db.relationship('AccountMember', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     sent_invitations = db.relationship('Invitation', foreign_keys='Invitation.inviter_id', backref='inviter', lazy='dynamic', cascade='all, delete-orphan')
     received_invitations = db.relationship('Invitation', foreign_keys='Invitation.invitee_email', primaryjoin='User.email==Invitation.invitee_email', lazy='dynamic')
     
+    def get_profile_image(self, size=None):
+        """Get the profile image filename, preferring the variant for a size if generated"""
+        if size and self.profile_image_variants:
+            variant = json.loads(self.profile_image_variants).get(size)
+            if variant:
+                return variant
+        return self.profile_image
+    
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Check if password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the password hash uses outdated hashing parameters"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def record_login(self):
         """Record a login event"""
+        from login_stats import increment_login_stat
+        # Hand off to the write-behind buffer when it is enabled
+        writer = current_app.extensions.get('login_writer')
+        if writer is not None:
+            writer.submit(self.id)
+            return
         login_entry = LoginHistory(user_id=self.id)
         db.session.add(login_entry)
+        increment_login_stat(self.id, datetime.utcnow().date())
         db.session.commit()
     
     def get_recent_login_count(self, days=30):
-        """Get number of logins in the last X days"""
-        from datetime import timedelta
-        cutoff_date = datetime.utcnow() - timedelta(days=days)
-        return self.login_history.filter(LoginHistory.login_time >= cutoff_date).count()
+        """Get number of logins in the last X days from the daily rollup"""
+        from login_stats import get_login_count
+        return get_login_count(self.id, days=days)
     
     def get_recent_logins(self, limit=10):
         """Get recent login records"""
@@ -59,6 +82,18 @@ class LoginHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     login_time = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    __table_args__ = (db.Index('ix_login_history_user_time', 'user_id', 'login_time'),)
+
+
+class LoginDailyStat(db.Model):
+    """Per-user, per-day login count rollup"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    login_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'day', name='unique_login_daily_stat'),)
 
 
 class Account(db.Model):
@@ -81,7 +116,10 @@ class AccountMember(db.Model):
     is_admin = db.Column(db.Boolean, default=False, nullable=False)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('account_id', 'user_id', name='unique_account_member'),)
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'user_id', name='unique_account_member'),
+        db.Index('ix_account_member_account_joined', 'account_id', 'joined_at', 'id'),
+    )
 
 
 class Invitation(db.Model):
@@ -93,3 +131,36 @@ class Invitation(db.Model):
     status = db.Column(db.String(20), default='pending', nullable=False)  # pending, accepted, declined
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     responded_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_invitation_account_status_created', 'account_id', 'status', 'created_at'),
+        db.Index('ix_invitation_invitee_status', 'invitee_email', 'status'),
+        # At most one pending invitation per account and email
+        db.Index('uq_invitation_pending', 'account_id', 'invitee_email', unique=True,
+                 sqlite_where=db.text("status = 'pending'"),
+                 postgresql_where=db.text("status = 'pending'")),
+    )
+
+
+class Job(db.Model):
+    """Unit of deferred work run by the job worker (see jobs.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    unique_key = db.Column(db.String(100))  # at most one queued or running job per key
+    
+    __table_args__ = (
+        db.Index('ix_job_status_kind_run_at', 'status', 'kind', 'run_at'),
+        db.Index('uq_job_unique_key_pending', 'unique_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')"),
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
@@ -0,0 +1,108 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.local import LocalProxy
+
+
+class PasswordHasher:
+    """Password hashing with configurable parameters and optional process offload
+
+    PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH are passed to werkzeug. With
+    PASSWORD_HASH_WORKERS > 0, hashes are computed in a process pool so the KDF
+    does not hold the GIL while other requests are served by the same process;
+    at most twice that many calls are in flight and the rest wait their turn.
+    Per-operation call counts and latencies are kept for metrics.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.salt_length = 16
+        self.workers = 0
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._current_method = None
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'scrypt')
+        self.salt_length = app.config.get('PASSWORD_SALT_LENGTH', 16)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self._current_method = None
+        self._slots = threading.BoundedSemaphore(self.workers * 2) if self.workers else None
+        app.extensions['password_hasher'] = self
+        atexit.register(self.shutdown)
+
+    @property
+    def hash_function(self):
+        """Picklable hashing function with the configured parameters"""
+        return partial(generate_password_hash, method=self.method, salt_length=self.salt_length)
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._call('hash', self.hash_function, password)
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash"""
+        return self._call('verify', check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """Whether a stored hash was made with different parameters than configured"""
+        if not pwhash or '$' not in pwhash:
+            return True
+        method, salt, _ = pwhash.split('$', 2)
+        return method != self.current_method or len(salt) != self.salt_length
+
+    @property
+    def current_method(self):
+        """The configured method with werkzeug's defaults expanded, e.g. scrypt:32768:8:1"""
+        if self._current_method is None:
+            self._current_method = generate_password_hash('', method=self.method, salt_length=1).split('$', 1)[0]
+        return self._current_method
+
+    def stats(self):
+        """Return {operation: {'count', 'total_seconds', 'max_seconds'}}"""
+        with self._lock:
+            return {name: dict(values) for name, values in self._stats.items()}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _call(self, name, fn, *args):
+        start = time.perf_counter()
+        try:
+            if not self.workers:
+                return fn(*args)
+            with self._slots:
+                return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn avoids forking a process that may have live threads
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _record(self, name, elapsed):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            stats['count'] += 1
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+
+# The instance create_app made for the current app
+password_hasher = LocalProxy(lambda: current_app.extensions['password_hasher'])
@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request, g
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests, ServiceUnavailable
+from werkzeug.local import LocalProxy
+
+# Atomically refill a bucket for the time since its last use and take tokens
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class MemoryBucketStore:
+    """Token buckets in this process, least recently used dropped past max_size"""
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """Take cost tokens; returns 0 if allowed, else seconds until they are available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            retry_after = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                retry_after = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker (requires the redis package)"""
+
+    def __init__(self, url, prefix='ratelimit:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_BACKEND = "redis" requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, key, rate, burst, cost=1):
+        return float(self._script(keys=[f'{self.prefix}{key}'], args=[rate, burst, time.time(), cost]))
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def _client_ip():
+    # ProxyFix rewrites remote_addr to the forwarded client when PROXY_FIX_X_FOR is set
+    return request.remote_addr or 'unknown'
+
+
+def _username():
+    # Login and registration posts are small url-encoded forms, so parsing them here is cheap
+    username = request.form.get('username', '').strip().lower()
+    return username or None
+
+
+def _user_id():
+    return current_user.get_id() if current_user.is_authenticated else None
+
+
+# Identities a budget can be keyed by; None means the budget does not apply
+SCOPES = {'ip': _client_ip, 'username': _username, 'user': _user_id}
+
+
+class AdmissionControl:
+    """Per-identity rate limits and concurrency caps for expensive endpoints
+
+    RATELIMIT_RULES gives each endpoint token-bucket budgets keyed by client
+    IP, submitted username or logged-in user; a budget of (count, seconds)
+    allows bursts of count requests refilled at count per seconds. A request
+    over any budget is rejected with 429 before the view runs. Buckets live in
+    this process ('memory') or in Redis so every worker shares them ('redis').
+
+    CONCURRENCY_LIMITS caps how many requests of a group (for example the
+    password-hashing endpoints) run at once in this process. A request waits
+    up to CONCURRENCY_QUEUE_TIMEOUT for a slot and is otherwise shed with 503.
+    Both responses carry Retry-After. Only RATELIMIT_METHODS are checked, so
+    rendering the login or profile form is never limited.
+    """
+
+    def __init__(self, app=None):
+        self.store = None
+        self._slots = {}
+        self._rejected = {}
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.store = None
+        if not app.config.get('RATELIMIT_ENABLED', True):
+            return
+        backend = app.config.get('RATELIMIT_BACKEND', 'memory')
+        if backend == 'memory':
+            self.store = MemoryBucketStore(max_size=app.config.get('RATELIMIT_STORE_SIZE', 100000))
+        elif backend == 'redis':
+            self.store = RedisBucketStore(app.config['RATELIMIT_REDIS_URL'])
+        else:
+            raise ValueError(f'Unknown RATELIMIT_BACKEND: {backend}')
+        self.rules = app.config.get('RATELIMIT_RULES', {})
+        for budgets in self.rules.values():
+            for scope in budgets:
+                if scope not in SCOPES:
+                    raise ValueError(f'Unknown RATELIMIT_RULES scope: {scope}')
+        self.methods = set(app.config.get('RATELIMIT_METHODS', ('POST',)))
+        self.groups = app.config.get('CONCURRENCY_GROUPS', {})
+        self.queue_timeout = app.config.get('CONCURRENCY_QUEUE_TIMEOUT', 0.25)
+        self.retry_after = app.config.get('CONCURRENCY_RETRY_AFTER', 1)
+        self._slots = {group: threading.BoundedSemaphore(limit)
+                       for group, limit in app.config.get('CONCURRENCY_LIMITS', {}).items() if limit}
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+        app.extensions['admission_control'] = self
+
+    def stats(self):
+        """Rejected requests as {(endpoint, reason): count}"""
+        with self._stats_lock:
+            return dict(self._rejected)
+
+    def _admit(self):
+        endpoint = request.endpoint
+        if request.method not in self.methods or endpoint is None:
+            return
+        for scope, (count, seconds) in self.rules.get(endpoint, {}).items():
+            identity = SCOPES[scope]()
+            if identity is None:
+                continue
+            retry_after = self.store.take(f'{endpoint}:{scope}:{identity}', count / seconds, count)
+            if retry_after:
+                self._count(endpoint, scope)
+                raise TooManyRequests(retry_after=int(retry_after) + 1)
+
+        group = self.groups.get(endpoint)
+        slots = self._slots.get(group)
+        if slots is not None:
+            if not slots.acquire(timeout=self.queue_timeout):
+                self._count(endpoint, 'concurrency')
+                raise ServiceUnavailable(retry_after=self.retry_after)
+            g.admission_slot = slots
+
+    def _release(self, exc):
+        slots = g.pop('admission_slot', None)
+        if slots is not None:
+            slots.release()
+
+    def _count(self, endpoint, reason):
+        with self._stats_lock:
+            self._rejected[endpoint, reason] = self._rejected.get((endpoint, reason), 0) + 1
+
+
+# The instance create_app made for the current app
+admission_control = LocalProxy(lambda: current_app.extensions['admission_control'])
@@ -0,0 +1,124 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert, or_
+from passwords import password_hasher
+from models import db, User, Account, AccountMember
+
+
+def default_account_name(username):
+    return f"{username}'s Account"
+
+
+def find_taken(username, email):
+    """Check username and email uniqueness with one query
+
+    Returns a (username_taken, email_taken) pair.
+    """
+    rows = db.session.query(User.username, User.email).filter(
+        or_(User.username == username, User.email == email)
+    ).all()
+    return (any(row.username == username for row in rows),
+            any(row.email == email for row in rows))
+
+
+def register_user(username, email, password):
+    """Create a user, their default account and owner membership in one transaction
+
+    Ids are assigned by flushing, so nothing is committed until all three rows
+    exist and a failure leaves no partial registration behind.
+    """
+    user = User(username=username, email=email)
+    user.set_password(password)
+    db.session.add(user)
+    try:
+        db.session.flush()
+
+        # Create a default account for the user
+        account = Account(name=default_account_name(user.username), owner_id=user.id)
+        db.session.add(account)
+        db.session.flush()
+
+        # Add user as admin member of their own account
+        db.session.add(AccountMember(account_id=account.id, user_id=user.id, is_admin=True))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return user
+
+
+def _hash_passwords(passwords, workers):
+    hash_function = password_hasher.hash_function
+    if workers > 1 and len(passwords) > 1:
+        # spawn avoids forking a process that may have live threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            return list(pool.map(hash_function, passwords, chunksize=64))
+    return [hash_function(password) for password in passwords]
+
+
+def provision_users(rows, batch_size=1000, workers=1):
+    """Bulk-create users with their default accounts and owner memberships
+
+    rows is an iterable of dicts with username, email and either password or a
+    precomputed password_hash. Each batch is inserted with three set-based
+    INSERT ... RETURNING statements and committed once. Users whose username or
+    email already exists are skipped. Returns (created, skipped) counts.
+    """
+    created = skipped = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            c, s = _provision_batch(batch, workers)
+            created, skipped = created + c, skipped + s
+            batch = []
+    if batch:
+        c, s = _provision_batch(batch, workers)
+        created, skipped = created + c, skipped + s
+    return created, skipped
+
+
+def _provision_batch(rows, workers):
+    usernames = [row['username'] for row in rows]
+    emails = [row['email'] for row in rows]
+    existing = db.session.query(User.username, User.email).filter(
+        or_(User.username.in_(usernames), User.email.in_(emails))
+    ).all()
+    taken = {row.username for row in existing} | {row.email for row in existing}
+
+    new_rows = []
+    seen = set()
+    for row in rows:
+        if row['username'] in taken or row['email'] in taken or row['username'] in seen or row['email'] in seen:
+            continue
+        seen.update((row['username'], row['email']))
+        new_rows.append(row)
+    if not new_rows:
+        return 0, len(rows)
+
+    to_hash = [row['password'] for row in new_rows if not row.get('password_hash')]
+    hashes = iter(_hash_passwords(to_hash, workers))
+    users = [{
+        'username': row['username'],
+        'email': row['email'],
+        'password_hash': row.get('password_hash') or next(hashes),
+    } for row in new_rows]
+
+    try:
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True), users
+        ).scalars().all()
+        account_ids = db.session.execute(
+            insert(Account).returning(Account.id, sort_by_parameter_order=True),
+            [{'name': default_account_name(user['username']), 'owner_id': user_id}
+             for user, user_id in zip(users, user_ids)]
+        ).scalars().all()
+        db.session.execute(insert(AccountMember), [
+            {'account_id': account_id, 'user_id': user_id, 'is_admin': True}
+            for user_id, account_id in zip(user_ids, account_ids)
+        ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(new_rows), len(rows) - len(new_rows)
@@ -0,0 +1,99 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_, case, tuple_
+from sqlalchemy.orm import joinedload
+from models import db, LoginHistory, Account, AccountMember, Invitation
+from login_stats import get_login_count
+
+
+def get_user_accounts(user_id):
+    """Get (account, is_owner, is_admin) entries for every account the user belongs to
+
+    Owned accounts and memberships are resolved in a single query by outer
+    joining the user's own membership row onto each account.
+    """
+    is_owner = Account.owner_id == user_id
+    rows = db.session.query(Account, AccountMember.is_admin).outerjoin(
+        AccountMember,
+        and_(AccountMember.account_id == Account.id, AccountMember.user_id == user_id)
+    ).filter(
+        or_(is_owner, AccountMember.user_id == user_id)
+    ).order_by(
+        case((is_owner, 0), else_=1), Account.id
+    ).all()
+
+    accounts = []
+    for account, member_is_admin in rows:
+        owner = account.owner_id == user_id
+        accounts.append({
+            'account': account,
+            'is_owner': owner,
+            'is_admin': owner or bool(member_is_admin)
+        })
+    return accounts
+
+
+def get_login_stats(user_id, days=30, limit=10):
+    """Get the login count for the last X days and the most recent login records"""
+    recent_login_count = get_login_count(user_id, days=days)
+    recent_logins = LoginHistory.query.filter_by(user_id=user_id).order_by(
+        LoginHistory.login_time.desc()
+    ).limit(limit).all()
+    return recent_login_count, recent_logins
+
+
+def get_dashboard_data(user, days=30, limit=10):
+    """Collect everything the dashboard renders in a fixed number of queries"""
+    recent_login_count, recent_logins = get_login_stats(user.id, days=days, limit=limit)
+    return {
+        'recent_login_count': recent_login_count,
+        'recent_logins': recent_logins,
+        'accounts': get_user_accounts(user.id)
+    }
+
+
+def encode_cursor(timestamp, row_id):
+    """Encode a (timestamp, id) keyset position as an opaque URL-safe token"""
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a token from encode_cursor, returning None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(query, time_column, id_column, cursor=None, limit=50):
+    """Fetch the page of rows after a cursor, ordered by (time_column, id_column)
+
+    Returns the rows and the cursor for the next page, or None on the last page.
+    """
+    position = decode_cursor(cursor)
+    if position is not None:
+        query = query.filter(tuple_(time_column, id_column) > position)
+    rows = query.order_by(time_column, id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+    return rows, next_cursor
+
+
+def get_account_members(account_id, cursor=None, limit=50):
+    """Get a page of account members with their users loaded in the same query"""
+    query = AccountMember.query.filter_by(account_id=account_id).options(joinedload(AccountMember.user))
+    return keyset_page(query, AccountMember.joined_at, AccountMember.id, cursor=cursor, limit=limit)
+
+
+def get_pending_invitations(account_id, cursor=None, limit=50):
+    """Get a page of an account's pending invitations with their inviters loaded"""
+    query = Invitation.query.filter_by(account_id=account_id, status='pending').options(joinedload(Invitation.inviter))
+    return keyset_page(query, Invitation.created_at, Invitation.id, cursor=cursor, limit=limit)
@@ -0,0 +1,54 @@
+import pytest
+from app import create_app
+from config import config, TestingConfig
+from models import db
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """Build an app on a fresh SQLite file with TestingConfig plus overrides
+
+    A file database (not sqlite://) lets job worker threads and replica binds
+    see the same data as the test.
+    """
+    apps = []
+
+    def make(**settings):
+        settings.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / f'app{len(apps)}.db'}")
+        monkeypatch.setitem(config, 'test', type('TestConfig', (TestingConfig,), settings))
+        app = create_app('test')
+        with app.app_context():
+            # Only the primary: db.metadatas keeps the replica bind keys of
+            # earlier apps, which this app may not have
+            db.create_all(bind_key=None)
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def register():
+    """Register a user through the form and leave the client logged in"""
+    def register(client, username, password='secret1'):
+        response = client.post('/register', data={'username': username, 'email': f'{username}@example.com',
+                                                  'password': password, 'password2': password})
+        assert response.status_code == 302, response.data
+        response = client.post('/login', data={'username': username, 'password': password})
+        assert response.status_code == 302, response.data
+    return register
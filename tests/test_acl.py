@@ -0,0 +1,72 @@
+import pytest
+from acl import resolver, OWNER, ADMIN, MEMBER
+from models import db, Account, AccountMember
+
+
+@pytest.fixture
+def cached(make_app, register):
+    """alice owns account 1 and bob is a plain member, with role maps cached across requests"""
+    app = make_app(ACL_CACHE_TTL=60, ACL_CACHE_BACKEND='memory')
+    register(app.test_client(), 'alice')
+    register(app.test_client(), 'bob')
+    with app.app_context():
+        db.session.add(AccountMember(account_id=1, user_id=2))
+        db.session.commit()
+    return app
+
+
+def roles(app, user_id):
+    """Roles as a fresh request sees them, so only the cross-request cache is involved"""
+    with app.app_context():
+        return resolver.roles_for(user_id)
+
+
+def test_roles_are_cached_until_a_change_commits(cached):
+    assert roles(cached, 2) == {1: MEMBER, 2: OWNER}
+    with cached.app_context():
+        assert resolver.backend.get(2) is not None
+        db.session.get(AccountMember, 3).is_admin = True
+        db.session.rollback()
+        assert resolver.backend.get(2) is not None
+
+        db.session.get(AccountMember, 3).is_admin = True
+        db.session.commit()
+        assert resolver.backend.get(2) is None
+    assert roles(cached, 2)[1] == ADMIN
+
+
+def test_ownership_transfer_drops_the_previous_owner(cached):
+    assert roles(cached, 1)[1] == OWNER
+    assert roles(cached, 2)[1] == MEMBER
+    with cached.app_context():
+        db.session.get(Account, 1).owner_id = 2
+        db.session.commit()
+    assert roles(cached, 2)[1] == OWNER
+    # alice keeps her admin membership row, but is no longer the owner
+    assert roles(cached, 1)[1] == ADMIN
+
+
+def test_reassigned_membership_drops_the_previous_member(make_app, register):
+    app = make_app(ACL_CACHE_TTL=60, ACL_CACHE_BACKEND='memory')
+    for name in ('alice', 'bob', 'carol'):
+        register(app.test_client(), name)
+    with app.app_context():
+        db.session.add(AccountMember(account_id=1, user_id=2, is_admin=True))
+        db.session.commit()
+    assert roles(app, 2)[1] == ADMIN
+    with app.app_context():
+        AccountMember.query.filter_by(account_id=1, user_id=2).one().user_id = 3
+        db.session.commit()
+    assert 1 not in roles(app, 2)
+    assert roles(app, 3)[1] == ADMIN
+
+
+def test_removed_member_loses_access_to_the_account_page(cached):
+    client = cached.test_client()
+    client.post('/login', data={'username': 'bob', 'password': 'secret1'})
+    assert client.get('/account/1').status_code == 200
+    with cached.app_context():
+        db.session.delete(AccountMember.query.filter_by(account_id=1, user_id=2).one())
+        db.session.commit()
+    response = client.get('/account/1')
+    assert response.status_code == 302 and response.location.endswith('/dashboard')
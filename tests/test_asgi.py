@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from models import db
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('aiosqlite')
+
+CONTENT = bytes(range(256)) * 1200
+
+
+@pytest.fixture
+def asgi_app(make_app, tmp_path):
+    from asgi import AsgiApplication
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'big.bin').write_bytes(CONTENT)
+    application = AsgiApplication(make_app(UPLOAD_FOLDER=str(tmp_path / 'uploads')), db)
+    yield application
+    if application.engines is not None:
+        asyncio.run(application.engines['primary'].dispose())
+    application.executor.shutdown()
+
+
+def run(application, *requests):
+    """Send (method, path, options) requests in order through one client, returning the responses"""
+    async def send():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+            return [await client.request(method, path, **options) for method, path, options in requests]
+    return asyncio.run(send())
+
+
+def test_sync_and_async_endpoints_share_the_session(asgi_app):
+    responses = run(
+        asgi_app,
+        ('POST', '/register', {'data': {'username': 'alice', 'email': 'alice@example.com',
+                                        'password': 'secret1', 'password2': 'secret1'}}),
+        ('POST', '/login', {'data': {'username': 'alice', 'password': 'secret1'}}),
+        ('GET', '/dashboard', {}),
+        ('GET', '/account/1', {}),
+        ('GET', '/account/99', {}),
+    )
+    assert [r.status_code for r in responses] == [302, 302, 200, 200, 302]
+    assert b'alice' in responses[2].content
+    assert b"alice&#39;s Account" in responses[3].content
+    assert responses[4].headers['location'] == '/dashboard'
+    # The dashboard and account page ran on the async engine
+    assert asgi_app.engines['primary'].url.drivername == 'sqlite+aiosqlite'
+
+
+def test_anonymous_async_request_is_redirected_to_login(asgi_app):
+    response, = run(asgi_app, ('GET', '/dashboard', {}))
+    assert response.status_code == 302 and response.headers['location'].startswith('/login')
+
+
+def test_files_are_streamed_with_range_support(asgi_app):
+    full, part, cached = run(
+        asgi_app,
+        ('GET', '/uploads/big.bin', {}),
+        ('GET', '/uploads/big.bin', {'headers': {'Range': 'bytes=1000-1999'}}),
+        ('GET', '/uploads/big.bin', {'headers': {'If-None-Match': '"missing"'}}),
+    )
+    assert full.status_code == 200 and full.content == CONTENT
+    assert part.status_code == 206 and part.content == CONTENT[1000:2000]
+    assert cached.status_code == 200
+    not_modified, = run(asgi_app, ('GET', '/uploads/big.bin', {'headers': {'If-None-Match': full.headers['etag']}}))
+    assert not_modified.status_code == 304 and not_modified.content == b''
+
+
+def test_concurrent_async_requests(asgi_app):
+    run(asgi_app,
+        ('POST', '/register', {'data': {'username': 'alice', 'email': 'alice@example.com',
+                                        'password': 'secret1', 'password2': 'secret1'}}))
+
+    async def send():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://localhost') as client:
+            await client.post('/login', data={'username': 'alice', 'password': 'secret1'})
+            return await asyncio.gather(*[client.get('/dashboard') for _ in range(20)])
+
+    assert {response.status_code for response in asyncio.run(send())} == {200}
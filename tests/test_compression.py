@@ -0,0 +1,57 @@
+import gzip
+import pytest
+from flask import request, send_file
+from flask_wtf.csrf import generate_csrf
+
+GZIP = {'Accept-Encoding': 'gzip'}
+PAGE = 'x' * 2000
+
+
+@pytest.fixture
+def compressed(make_app, tmp_path):
+    app = make_app()
+    page = tmp_path / 'page.txt'
+    page.write_text(PAGE)
+    app.add_url_rule('/page', 'page', lambda: PAGE, methods=['GET', 'POST'])
+    app.add_url_rule('/small', 'small', lambda: 'x' * 100)
+    app.add_url_rule('/form', 'form', lambda: PAGE + generate_csrf())
+    app.add_url_rule('/echo', 'echo', lambda: PAGE + request.args.get('q', ''))
+    app.add_url_rule('/file', 'file', lambda: send_file(page, mimetype='text/plain'))
+    app.add_url_rule('/error', 'error', lambda: (PAGE, 500))
+    return app.test_client()
+
+
+def test_large_pages_are_compressed(compressed):
+    response = compressed.get('/page', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert gzip.decompress(response.data).decode() == PAGE
+
+
+def test_uncompressed_without_accept_encoding_or_under_min_size(compressed):
+    response = compressed.get('/page')
+    assert 'Content-Encoding' not in response.headers and 'Accept-Encoding' in response.vary
+    assert 'Content-Encoding' not in compressed.get('/small', headers=GZIP).headers
+
+
+@pytest.mark.parametrize('method, path', [
+    ('GET', '/form'),         # renders a CSRF token
+    ('GET', '/echo?q=abc'),   # reflects attacker-controlled input
+    ('GET', '/page?q=abc'),
+    ('POST', '/page'),
+])
+def test_responses_that_may_leak_secrets_are_not_compressed(compressed, method, path):
+    response = compressed.open(path, method=method, headers=GZIP)
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_files_and_errors_are_not_compressed(compressed):
+    assert 'Content-Encoding' not in compressed.get('/file', headers=GZIP).headers
+    assert 'Content-Encoding' not in compressed.get('/error', headers=GZIP).headers
+
+
+def test_compression_can_be_disabled(make_app):
+    app = make_app(COMPRESS_ENABLED=False)
+    app.add_url_rule('/page', 'page', lambda: PAGE)
+    assert 'Content-Encoding' not in app.test_client().get('/page', headers=GZIP).headers
@@ -0,0 +1,42 @@
+import asyncio
+import pytest
+from sqlalchemy import text
+from database import create_async_engines
+from models import db
+
+
+def pragma(app, name):
+    with app.app_context():
+        return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+
+def test_each_app_keeps_its_own_sqlite_pragmas(make_app):
+    first = make_app(SQLITE_SYNCHRONOUS='FULL', SQLITE_CACHE_SIZE=-1000)
+    second = make_app(SQLITE_SYNCHRONOUS='OFF', SQLITE_CACHE_SIZE=-2000, SQLITE_MMAP_SIZE=None)
+    # Connections opened after the second app was created still get the first app's values
+    with first.app_context():
+        db.engine.dispose()
+    assert (pragma(first, 'synchronous'), pragma(first, 'cache_size')) == (2, -1000)
+    assert (pragma(second, 'synchronous'), pragma(second, 'cache_size')) == (0, -2000)
+    assert pragma(first, 'journal_mode') == 'wal'
+
+
+def test_async_engines_get_the_app_pragmas(make_app):
+    pytest.importorskip('aiosqlite')
+    app = make_app(SQLITE_SYNCHRONOUS='OFF', SQLITE_CACHE_SIZE=-3000)
+    make_app(SQLITE_SYNCHRONOUS='FULL', SQLITE_CACHE_SIZE=-1000)
+    with app.app_context():
+        engine = create_async_engines(app, db)['primary']
+
+    async def read():
+        async with engine.connect() as conn:
+            return ((await conn.execute(text('PRAGMA synchronous'))).scalar(),
+                    (await conn.execute(text('PRAGMA cache_size'))).scalar())
+
+    async def run():
+        try:
+            return await read()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(run()) == (0, -3000)
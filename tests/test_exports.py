@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+import pytest
+import exports
+from exports import parse_date, generate_export
+from models import db, User, LoginHistory
+
+DAYS = [datetime(2024, 3, day, hour, minute) for day in (1, 2, 3) for hour, minute in ((0, 0), (12, 0), (23, 59))]
+
+
+@pytest.fixture
+def logins(app):
+    with app.app_context():
+        user = User(username='alice', email='alice@example.com')
+        user.set_password('secret1')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(LoginHistory(user_id=1, login_time=time) for time in DAYS)
+        db.session.commit()
+    return app
+
+
+def exported_times(since=None, until=None):
+    data = b''.join(generate_export('logins', 'csv', since=since, until=until, user_id=1)).decode()
+    return [datetime.fromisoformat(row['login_time']) for row in csv.DictReader(io.StringIO(data))]
+
+
+def test_parse_date():
+    assert parse_date('') is None and parse_date(None) is None
+    assert parse_date('2024-03-02') == datetime(2024, 3, 2)
+    # A bare end date includes that whole day
+    assert parse_date('2024-03-02', end=True) == datetime(2024, 3, 3)
+    assert parse_date('2024-03-02T12:00', end=True) == datetime(2024, 3, 2, 12)
+    with pytest.raises(ValueError):
+        parse_date('March 2nd')
+
+
+def test_since_is_inclusive_and_until_exclusive(logins):
+    with logins.app_context():
+        assert exported_times() == DAYS
+        assert exported_times(since=datetime(2024, 3, 2)) == DAYS[3:]
+        assert exported_times(until=datetime(2024, 3, 2, 12)) == DAYS[:4]
+        # The whole of the 2nd, including logins at midnight and 23:59
+        day = exported_times(since=parse_date('2024-03-02'), until=parse_date('2024-03-02', end=True))
+        assert day == DAYS[3:6]
+
+
+def test_exports_stream_in_chunks_and_compress(logins, monkeypatch):
+    monkeypatch.setattr(exports, 'CHUNK_SIZE', 64)
+    monkeypatch.setattr(exports, 'YIELD_PER', 2)
+    with logins.app_context():
+        chunks = list(generate_export('logins', 'ndjson', user_id=1))
+        assert len(chunks) > 1
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        assert [row['login_time'] for row in rows] == [time.isoformat() for time in DAYS]
+        assert rows[0] == {'id': 1, 'user_id': 1, 'username': 'alice', 'login_time': '2024-03-01T00:00:00'}
+
+        compressed = b''.join(generate_export('logins', 'ndjson', compress=True, user_id=1))
+        assert gzip.decompress(compressed) == b''.join(chunks)
+
+
+def test_unknown_format_is_rejected(logins):
+    with logins.app_context():
+        with pytest.raises(ValueError):
+            list(generate_export('logins', 'xml', user_id=1))
+
+
+def test_login_export_view(logins):
+    client = logins.test_client()
+    client.post('/login', data={'username': 'alice', 'password': 'secret1'})
+
+    response = client.get('/export/logins.csv?since=2024-03-02&until=2024-03-02')
+    assert response.status_code == 200 and response.is_streamed
+    assert response.headers['Content-Disposition'].startswith('attachment; filename=logins-')
+    assert response.headers['X-Accel-Buffering'] == 'no'
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['login_time'] for row in rows] == [time.isoformat() for time in DAYS[3:6]]
+
+    response = client.get('/export/logins.ndjson?gzip=1')
+    assert response.mimetype == 'application/gzip'
+    # Including the login above
+    assert len(gzip.decompress(response.data).splitlines()) == len(DAYS) + 1
+
+    assert client.get('/export/logins.csv?since=yesterday').status_code == 400
@@ -0,0 +1,41 @@
+from fragments import fragment_cache
+from models import db, User, AccountMember
+
+
+def test_fragment_versions_change_only_when_a_write_commits(make_app, register):
+    app = make_app(FRAGMENT_CACHE_BACKEND='memory')
+    client = app.test_client()
+    register(client, 'alice')
+    register(app.test_client(), 'bob')
+
+    with app.app_context():
+        before = fragment_cache.versions(['account:1', 'user:2'])
+        assert fragment_cache.versions(['account:1', 'user:2']) == before
+
+        db.session.add(AccountMember(account_id=1, user_id=2))
+        db.session.rollback()
+        assert fragment_cache.versions(['account:1', 'user:2']) == before
+
+        db.session.add(AccountMember(account_id=1, user_id=2))
+        db.session.commit()
+        after = fragment_cache.versions(['account:1', 'user:2'])
+        assert after[0] != before[0] and after[1] != before[1]
+
+
+def test_cached_member_table_shows_new_members_and_names(make_app, register):
+    app = make_app(FRAGMENT_CACHE_BACKEND='memory')
+    client = app.test_client()
+    register(client, 'alice')
+    register(app.test_client(), 'bob')
+    assert b'bob' not in client.get('/account/1').data
+
+    with app.app_context():
+        db.session.add(AccountMember(account_id=1, user_id=2))
+        db.session.commit()
+    assert b'bob' in client.get('/account/1').data
+
+    with app.app_context():
+        db.session.get(User, 2).username = 'robert'
+        db.session.commit()
+    page = client.get('/account/1').data
+    assert b'robert' in page and b'bob@' in page
@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import pytest
+from images import ImagePipeline
+from jobs import job_queue
+from models import db, User, Job
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.fixture
+def uploads(make_app, register, tmp_path):
+    """alice and bob registered, with uploads stored under a temporary folder"""
+    app = make_app(UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+    clients = {}
+    for name in ('alice', 'bob'):
+        clients[name] = app.test_client()
+        register(clients[name], name)
+    return app, clients
+
+
+def upload(client, color):
+    data = io.BytesIO()
+    Image.new('RGB', (50, 40), color).save(data, 'PNG')
+    response = client.post('/profile', data={
+        'first_name': '', 'last_name': '', 'display_name': '', 'city': '', 'state': '', 'country': '',
+        'profile_image': (io.BytesIO(data.getvalue()), 'photo.png'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+
+def run_jobs(app):
+    with app.app_context():
+        job_queue.work(once=True, poll_interval=0.01)
+
+
+def stored(app):
+    return {name for name in os.listdir(app.config['UPLOAD_FOLDER']) if not name.startswith('.')}
+
+
+def profile(app, user_id):
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        variants = json.loads(user.profile_image_variants) if user.profile_image_variants else None
+        return user.profile_image, variants
+
+
+def test_variants_are_generated_by_a_queued_job(uploads):
+    app, clients = uploads
+    upload(clients['alice'], 'red')
+    image, variants = profile(app, 1)
+    assert variants is None
+    with app.app_context():
+        assert [job.kind for job in Job.query] == ['image_variants']
+
+    run_jobs(app)
+    image, variants = profile(app, 1)
+    assert sorted(variants) == ['large', 'medium', 'thumb']
+    assert stored(app) == {image, *variants.values()}
+
+
+def test_identical_upload_reuses_stored_variants(uploads):
+    app, clients = uploads
+    upload(clients['alice'], 'red')
+    run_jobs(app)
+    upload(clients['bob'], 'red')
+    assert profile(app, 2) == profile(app, 1)
+    with app.app_context():
+        assert Job.query.filter_by(kind='image_variants').count() == 1
+
+
+def test_replaced_image_is_discarded_unless_still_used(uploads):
+    app, clients = uploads
+    upload(clients['alice'], 'red')
+    upload(clients['bob'], 'red')
+    run_jobs(app)
+    red = stored(app)
+
+    upload(clients['alice'], 'blue')
+    run_jobs(app)
+    # bob still uses the red image
+    assert red <= stored(app)
+
+    upload(clients['bob'], 'green')
+    run_jobs(app)
+    assert not red & stored(app)
+    assert len(stored(app)) == 8
+
+
+def test_discard_puts_files_back_for_an_upload_committed_meanwhile(uploads, monkeypatch):
+    app, clients = uploads
+    upload(clients['alice'], 'red')
+    run_jobs(app)
+    red = stored(app)
+    upload(clients['alice'], 'blue')
+
+    checks = []
+    referenced = ImagePipeline._referenced
+
+    def upload_between_checks(self, filename):
+        checks.append(filename)
+        if len(checks) == 2:
+            # bob's upload of the same content commits after the first check
+            upload(clients['bob'], 'red')
+        return referenced(self, filename)
+
+    monkeypatch.setattr(ImagePipeline, '_referenced', upload_between_checks)
+    with app.app_context():
+        job_queue.work(kinds=['discard_image'], once=True, poll_interval=0.01)
+    assert len(checks) == 2
+    assert red <= stored(app)
+    assert profile(app, 2)[0] in red
+
+
+def test_upload_stores_its_file_again_after_a_discard_removed_it(uploads, monkeypatch):
+    app, clients = uploads
+    upload(clients['alice'], 'red')
+    run_jobs(app)
+    red = stored(app)
+
+    existing_variants = ImagePipeline.existing_variants
+    removed = []
+
+    def discard_before_commit(self, filename):
+        variants = existing_variants(self, filename)
+        if not removed:
+            # A discard_image job deletes the shared files between save_upload and the commit
+            for name in red:
+                os.remove(os.path.join(self.upload_folder, name))
+            removed.extend(red)
+        return variants
+
+    monkeypatch.setattr(ImagePipeline, 'existing_variants', discard_before_commit)
+    upload(clients['bob'], 'red')
+
+    image, variants = profile(app, 2)
+    assert image in stored(app) and variants is None
+    run_jobs(app)
+    assert stored(app) == red
+    assert profile(app, 2) == profile(app, 1)
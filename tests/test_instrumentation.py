@@ -0,0 +1,49 @@
+import pytest
+
+TOKEN = {'Authorization': 'Bearer s3cret'}
+
+
+@pytest.fixture
+def profiled(make_app):
+    def make(**settings):
+        return make_app(PROFILING_ENABLED=True, PROFILING_DUMP_DIR=None, **settings).test_client()
+    return make
+
+
+def test_metrics_are_hidden_without_a_token_or_allowlist(profiled):
+    client = profiled()
+    assert client.get('/internal/metrics').status_code == 404
+    assert client.get('/internal/metrics', headers=TOKEN).status_code == 404
+
+
+def test_metrics_token(profiled):
+    client = profiled(PROFILING_METRICS_TOKEN='s3cret')
+    assert client.get('/internal/metrics').status_code == 404
+    assert client.get('/internal/metrics', headers={'Authorization': 'Bearer nope'}).status_code == 404
+    assert client.get('/internal/metrics', headers={'Authorization': 's3cret'}).status_code == 404
+    assert client.get('/internal/metrics', headers=TOKEN).status_code == 200
+
+
+def test_allowlist_ignores_loopback_without_a_trusted_proxy(profiled):
+    client = profiled(PROFILING_METRICS_ALLOWED_IPS=['127.0.0.1', '10.1.1.1'])
+    # The test client, like a local reverse proxy, connects from 127.0.0.1
+    assert client.get('/internal/metrics').status_code == 404
+    assert client.get('/internal/metrics', environ_base={'REMOTE_ADDR': '10.1.1.1'}).status_code == 200
+    assert client.get('/internal/metrics', environ_base={'REMOTE_ADDR': '10.1.1.2'}).status_code == 404
+
+
+def test_allowlist_checks_the_forwarded_client_behind_a_proxy(profiled):
+    client = profiled(PROFILING_METRICS_ALLOWED_IPS=['127.0.0.1'], PROXY_FIX_X_FOR=1)
+    assert client.get('/internal/metrics').status_code == 200
+    assert client.get('/internal/metrics', headers={'X-Forwarded-For': '1.2.3.4'}).status_code == 404
+
+
+def test_requests_are_counted_per_endpoint(profiled):
+    client = profiled(PROFILING_METRICS_TOKEN='s3cret')
+    client.get('/login')
+    client.get('/login')
+    response = client.get('/internal/metrics', headers=TOKEN)
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert 'app_request_duration_seconds_count{endpoint="login"} 2' in body
+    assert '# TYPE app_sql_queries_total counter' in body
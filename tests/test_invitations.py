@@ -0,0 +1,78 @@
+import io
+import invitations
+from invitations import (parse_emails, invite_emails, IN_BATCH_SIZE,
+                         INVITED, ALREADY_MEMBER, ALREADY_INVITED, DUPLICATE, INVALID)
+from models import db, User, Account, AccountMember, Invitation, Job
+
+
+def setup_account():
+    """Account 1 owned by alice, with member bob, outsider carol and a pending invitation for dave"""
+    users = [User(username=name, email=f'{name}@example.com') for name in ('alice', 'bob', 'carol')]
+    db.session.add_all(users)
+    db.session.flush()
+    db.session.add(Account(id=1, name='Shared', owner_id=users[0].id))
+    db.session.add_all([
+        AccountMember(account_id=1, user_id=users[0].id, is_admin=True),
+        AccountMember(account_id=1, user_id=users[1].id),
+        Invitation(account_id=1, inviter_id=users[0].id, invitee_email='dave@example.com'),
+        Invitation(account_id=1, inviter_id=users[0].id, invitee_email='erin@example.com', status='declined'),
+    ])
+    db.session.commit()
+
+
+def queued_emails():
+    return sorted(Job.query.filter_by(kind='invitation_email').with_entities(Job.payload).all())
+
+
+def test_each_email_gets_an_outcome_in_input_order(app):
+    with app.app_context():
+        setup_account()
+        emails = ['bob@example.com', 'carol@example.com', 'dave@example.com', 'not-an-email',
+                  ' carol@example.com ', 'erin@example.com', 'frank@example.com']
+        assert invite_emails(1, 1, emails) == [
+            ('bob@example.com', ALREADY_MEMBER),
+            ('carol@example.com', INVITED),
+            ('dave@example.com', ALREADY_INVITED),
+            ('not-an-email', INVALID),
+            ('carol@example.com', DUPLICATE),
+            # A declined invitation does not block a new one
+            ('erin@example.com', INVITED),
+            ('frank@example.com', INVITED),
+        ]
+        pending = {i.invitee_email for i in Invitation.query.filter_by(status='pending')}
+        assert pending == {'carol@example.com', 'dave@example.com', 'erin@example.com', 'frank@example.com'}
+        assert len(queued_emails()) == 3
+
+
+def test_lookups_are_batched_across_the_parameter_limit(app):
+    with app.app_context():
+        setup_account()
+        emails = [f'new{i}@example.com' for i in range(IN_BATCH_SIZE * 2 + 10)] + ['bob@example.com']
+        outcomes = invite_emails(1, 1, emails)
+        assert outcomes[-1] == ('bob@example.com', ALREADY_MEMBER)
+        assert all(outcome == INVITED for _, outcome in outcomes[:-1])
+        assert Invitation.query.filter_by(status='pending').count() == len(emails)  # dave plus the new ones
+
+
+def test_invitations_made_concurrently_are_reported_as_already_invited(app, monkeypatch):
+    with app.app_context():
+        setup_account()
+        # The lookups miss dave's invitation, as if it was committed just after them
+        monkeypatch.setattr(invitations, '_batches', lambda items, size=IN_BATCH_SIZE: iter(()))
+        outcomes = invite_emails(1, 1, ['dave@example.com', 'frank@example.com'])
+        assert outcomes == [('dave@example.com', ALREADY_INVITED), ('frank@example.com', INVITED)]
+        assert Invitation.query.filter_by(invitee_email='dave@example.com').count() == 1
+        assert len(queued_emails()) == 1
+
+
+def test_parse_emails_reads_text_and_csv_cells():
+    csv_file = io.BytesIO('\ufeffname,email\nGina,gina@example.com\nHal,"hal@example.com"\n'.encode())
+    assert parse_emails('a@example.com, b@example.com;c@example.com\nd@example.com', csv_file) == [
+        'a@example.com', 'b@example.com', 'c@example.com', 'd@example.com', 'gina@example.com', 'hal@example.com']
+
+
+def test_bulk_invite_page_lists_outcomes(app, client, register):
+    register(client, 'alice')
+    response = client.post('/account/1/invite/bulk', data={'emails': 'bob@example.com, bob@example.com, nope'})
+    assert response.status_code == 200
+    assert b'1 of 3 invitations sent.' in response.data
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+import pytest
+from jobs import job_queue, job_task, TASKS, QUEUED, RUNNING, DONE, FAILED
+from models import db, Job
+
+
+@pytest.fixture
+def task():
+    """Register a throwaway job kind for the test and remove it afterwards"""
+    kinds = []
+
+    def register(kind, **options):
+        def decorator(handler):
+            kinds.append(kind)
+            return job_task(kind, **options)(handler)
+        return decorator
+
+    yield register
+    for kind in kinds:
+        TASKS.pop(kind, None)
+
+
+def queue(kind, count):
+    job_queue.enqueue_many(kind, [{'n': n} for n in range(count)])
+    db.session.commit()
+
+
+def statuses(kind):
+    return sorted(status for status, in db.session.query(Job.status).filter_by(kind=kind))
+
+
+def test_batches_are_claimed_up_to_batch_size(app, task):
+    batches = []
+
+    @task('test_batch', batch_size=3)
+    def handler(payloads):
+        batches.append(sorted(p['n'] for p in payloads))
+
+    with app.app_context():
+        queue('test_batch', 7)
+        assert job_queue.work(kinds=['test_batch'], threads=1, once=True, poll_interval=0.01) == 7
+        assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+        assert statuses('test_batch') == [DONE] * 7
+
+
+def test_claims_are_disjoint(app, task):
+    task('test_disjoint', batch_size=2)(lambda payloads: None)
+
+    with app.app_context():
+        queue('test_disjoint', 3)
+        first_claim, first = job_queue._claim(TASKS['test_disjoint'], 'worker-a')
+        second_claim, second = job_queue._claim(TASKS['test_disjoint'], 'worker-b')
+        _, third = job_queue._claim(TASKS['test_disjoint'], 'worker-c')
+        assert len(first) == 2 and len(second) == 1 and third == []
+        assert not {job.id for job in first} & {job.id for job in second}
+        assert first_claim != second_claim
+
+
+def test_concurrency_counts_running_batches(app, task):
+    task('test_solo', batch_size=2, concurrency=1)(lambda payloads: None)
+
+    with app.app_context():
+        queue('test_solo', 4)
+        _, first = job_queue._claim(TASKS['test_solo'], 'worker-a')
+        _, second = job_queue._claim(TASKS['test_solo'], 'worker-b')
+        assert len(first) == 2 and second == []
+        assert statuses('test_solo') == [QUEUED, QUEUED, RUNNING, RUNNING]
+
+
+def test_failed_batch_is_retried_until_max_attempts(app, task):
+    calls = []
+
+    @task('test_flaky', max_attempts=2)
+    def handler(payload):
+        calls.append(payload)
+        raise RuntimeError('boom')
+
+    with app.app_context():
+        job_queue.backoff_base = 0
+        queue('test_flaky', 1)
+        for _ in range(3):
+            job_queue.work(kinds=['test_flaky'], once=True, poll_interval=0.01)
+        job = Job.query.filter_by(kind='test_flaky').one()
+        assert len(calls) == 2
+        assert (job.status, job.attempts) == (FAILED, 2)
+        assert 'RuntimeError: boom' in job.last_error
+
+        assert job_queue.retry_failed('test_flaky') == 1
+        assert statuses('test_flaky') == [QUEUED]
+
+
+def test_heartbeat_keeps_running_jobs_locked(app, task):
+    task('test_slow')(lambda payload: None)
+
+    with app.app_context():
+        queue('test_slow', 2)
+        alive, _ = job_queue._claim(TASKS['test_slow'], 'worker-a')
+        job_queue._claim(TASKS['test_slow'], 'worker-b')
+        expired = datetime.utcnow() - timedelta(seconds=job_queue.lock_timeout + 1)
+        Job.query.update({Job.locked_at: expired})
+        db.session.commit()
+
+        job_queue._heartbeat([alive])
+        assert job_queue.requeue_stale() == 1
+        assert statuses('test_slow') == [QUEUED, RUNNING]
+
+
+def test_recurring_jobs_are_queued_once(app, task):
+    task('test_recurring')(lambda payload: None)
+
+    with app.app_context():
+        job_queue.schedule = {'test_recurring': 60}
+        job_queue._schedule_recurring([TASKS['test_recurring']])
+        job_queue._schedule_recurring([TASKS['test_recurring']])
+        assert statuses('test_recurring') == [QUEUED]
+
+
+def test_invitation_emails_are_sent_in_batches(app, client, register):
+    register(client, 'alice')
+    emails = [f'guest{i}@example.com' for i in range(60)]
+    client.post('/account/1/invite/bulk', data={'emails': ', '.join(emails)})
+
+    with app.app_context():
+        assert job_queue.work(kinds=['invitation_email'], once=True, poll_interval=0.01) == 60
+        outbox = app.extensions['mailer'].transport.outbox
+        assert sorted(message['To'] for message in outbox) == sorted(emails)
+        assert statuses('invitation_email') == [DONE] * 60
+
+
+def test_no_recurring_jobs_are_queued_by_default(app):
+    with app.app_context():
+        job_queue.work(once=True, poll_interval=0.01)
+        assert Job.query.count() == 0
@@ -0,0 +1,69 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from login_stats import rebuild_login_stats, compact_login_history, get_login_count
+from models import db, User, LoginHistory, LoginDailyStat
+
+MIDNIGHT = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+
+
+def add_history(days_ago):
+    """Logins for two users on each of the given days, including both ends of each day"""
+    users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(2)]
+    db.session.add_all(users)
+    db.session.flush()
+    times = []
+    for index, days in enumerate(days_ago):
+        day = MIDNIGHT - timedelta(days=days)
+        times += [day, day + timedelta(hours=12), day + timedelta(hours=23, minutes=59, seconds=59)][:index % 3 + 1]
+    db.session.add_all(LoginHistory(user_id=user.id, login_time=time) for user in users for time in times)
+    db.session.commit()
+    return users
+
+
+def raw_counts(before=None):
+    query = db.session.query(LoginHistory.user_id, LoginHistory.login_time)
+    if before is not None:
+        query = query.filter(LoginHistory.login_time < before)
+    return Counter((user_id, time.date()) for user_id, time in query)
+
+
+def rollups():
+    return {(stat.user_id, stat.day): stat.login_count for stat in LoginDailyStat.query}
+
+
+def test_backfill_matches_raw_counts_across_batches(app):
+    with app.app_context():
+        # Gaps and more than one seven-day batch, with logins right at midnight
+        add_history([0, 1, 6, 7, 8, 13, 14, 30, 31, 45])
+        expected = raw_counts()
+
+        assert rebuild_login_stats() == len(expected)
+        assert rollups() == expected
+        rebuild_login_stats()
+        assert rollups() == expected
+
+
+def test_compaction_keeps_rollup_totals_and_deletes_old_history(app):
+    with app.app_context():
+        add_history([1, 2, 89, 90, 91, 92, 97, 98, 120, 200])
+        rebuild_login_stats()
+        expected = rollups()
+        cutoff = MIDNIGHT - timedelta(days=90)
+        old = sum(raw_counts(before=cutoff).values())
+
+        assert compact_login_history(days=90) == old
+        assert rollups() == expected
+        assert LoginHistory.query.filter(LoginHistory.login_time < cutoff).count() == 0
+        assert raw_counts() == Counter({key: count for key, count in expected.items() if key[1] >= cutoff.date()})
+        # A second run has nothing left to fold
+        assert compact_login_history(days=90) == 0
+        assert rollups() == expected
+
+
+def test_login_updates_the_rollup(app, client, register):
+    register(client, 'alice')
+    client.get('/logout')
+    client.post('/login', data={'username': 'alice', 'password': 'secret1'})
+    with app.app_context():
+        assert get_login_count(1) == 2
+        assert get_login_count(1) == LoginHistory.query.filter_by(user_id=1).count()
@@ -0,0 +1,71 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from login_stats import get_login_count
+from models import db, User, LoginHistory, LoginDailyStat
+
+
+@pytest.fixture
+def buffered(make_app):
+    app = make_app(LOGIN_WRITE_BEHIND=True, LOGIN_WRITE_BATCH_SIZE=5, LOGIN_WRITE_FLUSH_INTERVAL=60)
+    with app.app_context():
+        db.session.add(User(username='alice', email='alice@example.com'))
+        db.session.commit()
+    writer = app.extensions['login_writer']
+    yield app, writer
+    writer.close()
+
+
+def logins():
+    db.session.remove()
+    return LoginHistory.query.count()
+
+
+def test_flush_writes_pending_events_and_rollups(buffered):
+    app, writer = buffered
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    for login_time in (None, None, yesterday):
+        writer.submit(1, login_time)
+    with app.app_context():
+        # Under the batch size and well inside the flush interval, nothing is written yet
+        assert logins() == 0
+        writer.flush(timeout=5)
+        assert logins() == 3
+        assert sorted(stat.login_count for stat in LoginDailyStat.query) == [1, 2]
+        assert get_login_count(1) == 3
+
+
+def test_full_batch_is_written_without_a_flush(buffered):
+    app, writer = buffered
+    for _ in range(5):
+        writer.submit(1)
+    with app.app_context():
+        deadline = time.monotonic() + 5
+        while logins() < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert logins() == 5
+
+
+def test_close_writes_pending_events_and_stops_the_thread(buffered):
+    app, writer = buffered
+    writer.submit(1)
+    writer.submit(1)
+    thread = writer._thread
+    writer.close()
+    assert not thread.is_alive() and writer._thread is None
+    with app.app_context():
+        assert logins() == 2
+    # Submitting again starts a new thread
+    writer.submit(1)
+    writer.flush(timeout=5)
+    with app.app_context():
+        assert logins() == 3
+
+
+def test_login_goes_through_the_buffer(buffered, register):
+    app, writer = buffered
+    client = app.test_client()
+    register(client, 'bob')
+    writer.flush(timeout=5)
+    with app.app_context():
+        assert LoginHistory.query.filter_by(user_id=2).count() == 1
@@ -0,0 +1,65 @@
+from datetime import datetime
+from models import db, User, Account, AccountMember, Invitation
+from services import get_account_members, get_pending_invitations, encode_cursor
+
+SAME_TIME = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def pages(fetch, account_id, limit):
+    cursor, seen = None, []
+    while True:
+        rows, cursor = fetch(account_id, cursor=cursor, limit=limit)
+        seen.append([row.id for row in rows])
+        if cursor is None:
+            return seen
+
+
+def add_account(member_count):
+    users = [User(username=f'user{i}', email=f'user{i}@example.com') for i in range(member_count)]
+    db.session.add_all(users)
+    db.session.flush()
+    account = Account(name='Shared', owner_id=users[0].id)
+    db.session.add(account)
+    db.session.flush()
+    db.session.add_all(AccountMember(account_id=account.id, user_id=user.id, joined_at=SAME_TIME) for user in users)
+    db.session.commit()
+    return account
+
+
+def test_members_with_the_same_join_time_are_each_listed_once(app):
+    with app.app_context():
+        account = add_account(7)
+        seen = pages(get_account_members, account.id, limit=3)
+        ids = [member_id for page in seen for member_id in page]
+        assert [len(page) for page in seen] == [3, 3, 1]
+        assert ids == sorted(ids) and len(set(ids)) == 7
+
+
+def test_pending_invitations_with_the_same_time_are_each_listed_once(app):
+    with app.app_context():
+        account = add_account(1)
+        db.session.add_all(Invitation(account_id=account.id, inviter_id=account.owner_id, status='pending',
+                                      invitee_email=f'guest{i}@example.com', created_at=SAME_TIME)
+                           for i in range(5))
+        db.session.commit()
+        seen = pages(get_pending_invitations, account.id, limit=2)
+        ids = [invitation_id for page in seen for invitation_id in page]
+        assert [len(page) for page in seen] == [2, 2, 1]
+        assert ids == sorted(ids) and len(set(ids)) == 5
+
+
+def test_cursor_resumes_after_the_last_row_on_a_tie(app):
+    with app.app_context():
+        account = add_account(4)
+        rows, cursor = get_account_members(account.id, limit=2)
+        assert cursor == encode_cursor(SAME_TIME, rows[-1].id)
+        rest, _ = get_account_members(account.id, cursor=cursor, limit=10)
+        assert [row.id for row in rest] == [rows[-1].id + 1, rows[-1].id + 2]
+
+
+def test_malformed_cursor_starts_from_the_first_page(app):
+    with app.app_context():
+        account = add_account(3)
+        first, _ = get_account_members(account.id, limit=2)
+        rows, _ = get_account_members(account.id, cursor='not-a-cursor', limit=2)
+        assert [row.id for row in rows] == [row.id for row in first]
@@ -0,0 +1,49 @@
+from werkzeug.security import check_password_hash
+from models import User
+
+
+def stored_hash(app):
+    with app.app_context():
+        return User.query.filter_by(username='alice').one().password_hash
+
+
+def login(app, password='secret1'):
+    return app.test_client().post('/login', data={'username': 'alice', 'password': password})
+
+
+def test_login_upgrades_hashes_made_with_old_parameters(make_app, register, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'shared.db'}"
+    old = make_app(SQLALCHEMY_DATABASE_URI=uri)
+    register(old.test_client(), 'alice')
+    old_hash = stored_hash(old)
+    assert old_hash.startswith('pbkdf2:sha256:1000$')
+
+    new = make_app(SQLALCHEMY_DATABASE_URI=uri, PASSWORD_HASH_METHOD='pbkdf2:sha256:2000', PASSWORD_SALT_LENGTH=8)
+    # A failed login leaves the stored hash alone
+    assert login(new, 'wrong').status_code == 200
+    assert stored_hash(new) == old_hash
+
+    assert login(new).status_code == 302
+    new_hash = stored_hash(new)
+    method, salt, _ = new_hash.split('$')
+    assert method == 'pbkdf2:sha256:2000' and len(salt) == 8
+    assert check_password_hash(new_hash, 'secret1')
+
+    # Current hashes are not rewritten on every login
+    assert login(new).status_code == 302
+    assert stored_hash(new) == new_hash
+    # and the old parameters still verify the upgraded hash
+    assert login(old).status_code == 302
+
+
+def test_hashing_in_a_process_pool_records_stats(make_app):
+    app = make_app(PASSWORD_HASH_WORKERS=1)
+    hasher = app.extensions['password_hasher']
+    try:
+        pwhash = hasher.hash('secret1')
+        assert hasher.verify(pwhash, 'secret1') and not hasher.verify(pwhash, 'wrong')
+        assert not hasher.needs_rehash(pwhash)
+        stats = hasher.stats()
+        assert stats['hash']['count'] == 1 and stats['verify']['count'] == 2
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def limited(make_app):
+    return make_app(RATELIMIT_ENABLED=True, RATELIMIT_RULES={'login': {'ip': (5, 60), 'username': (2, 60)}})
+
+
+def login(client, username, **kwargs):
+    return client.post('/login', data={'username': username, 'password': 'wrong'}, **kwargs)
+
+
+def test_username_budget_rejects_with_429(limited):
+    client = limited.test_client()
+    assert [login(client, 'Eve').status_code for _ in range(2)] == [200, 200]
+    response = login(client, 'eve')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # Other usernames and plain page views are unaffected
+    assert login(client, 'bob').status_code == 200
+    assert client.get('/login').status_code == 200
+
+
+def test_ip_budget_is_per_client_address(limited):
+    client = limited.test_client()
+    codes = [login(client, f'user{i}').status_code for i in range(6)]
+    assert codes == [200] * 5 + [429]
+    assert login(client, 'user6', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+
+
+def test_forwarded_address_is_used_behind_a_trusted_proxy(make_app):
+    app = make_app(RATELIMIT_ENABLED=True, RATELIMIT_RULES={'login': {'ip': (1, 60)}}, PROXY_FIX_X_FOR=1)
+    client = app.test_client()
+    assert login(client, 'a', headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 200
+    assert login(client, 'b', headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 429
+    assert login(client, 'c', headers={'X-Forwarded-For': '203.0.113.2'}).status_code == 200
+
+
+def test_rejections_are_counted(limited):
+    client = limited.test_client()
+    for _ in range(3):
+        login(client, 'eve')
+    assert limited.extensions['admission_control'].stats() == {('login', 'username'): 1}
@@ -0,0 +1,34 @@
+from werkzeug.security import check_password_hash
+from models import db, User, Account, AccountMember
+from registration import provision_users
+
+
+def test_taken_username_and_email_are_reported_with_other_errors(client, register):
+    register(client, 'alice')
+    client.get('/logout')
+    response = client.post('/register', data={'username': 'alice', 'email': 'alice@example.com',
+                                              'password': 'secret1', 'password2': 'different'})
+    assert response.status_code == 200
+    assert b'Passwords must match' in response.data
+    assert b'Username already taken' in response.data
+    assert b'Email already registered' in response.data
+
+
+def test_registration_creates_the_default_account(app, client, register):
+    register(client, 'alice')
+    with app.app_context():
+        account = Account.query.one()
+        assert account.name == "alice's Account" and account.owner_id == 1
+        assert AccountMember.query.filter_by(account_id=account.id, user_id=1, is_admin=True).count() == 1
+
+
+def test_provisioning_hashes_in_spawned_workers_and_skips_taken_users(app):
+    rows = [{'username': f'user{i}', 'email': f'user{i}@example.com', 'password': f'secret{i}'} for i in range(4)]
+    rows.append({'username': 'user0', 'email': 'other@example.com', 'password': 'secret'})
+    with app.app_context():
+        assert provision_users(rows, batch_size=3, workers=2) == (4, 1)
+        assert provision_users(rows[:2], workers=2) == (0, 2)
+        users = User.query.order_by(User.id).all()
+        assert [user.username for user in users] == ['user0', 'user1', 'user2', 'user3']
+        assert all(check_password_hash(user.password_hash, f'secret{i}') for i, user in enumerate(users))
+        assert db.session.query(AccountMember).filter_by(is_admin=True).count() == 4
@@ -0,0 +1,43 @@
+import shutil
+import pytest
+from database import replica_reads
+from models import db, User, Account
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path, register):
+    """An app with one replica holding a snapshot taken after alice registered"""
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{primary}',
+                   SQLALCHEMY_REPLICA_URIS=[f'sqlite:///{replica}'])
+    register(app.test_client(), 'alice')
+    with app.app_context():
+        db.session.remove()
+        # Closing the last connection checkpoints the WAL into the file
+        db.engines[None].dispose()
+        shutil.copy(primary, replica)
+        db.session.get(Account, 1).name = 'Renamed on primary'
+        db.session.commit()
+    return app
+
+
+def test_reads_use_the_replica_until_the_session_writes(replicated):
+    with replicated.app_context():
+        with replica_reads(db.session()):
+            assert db.session.get(Account, 1).name != 'Renamed on primary'
+            db.session.get(User, 1).display_name = 'Alice'
+            db.session.flush()
+            db.session.expire_all()
+            assert db.session.get(Account, 1).name == 'Renamed on primary'
+
+
+def test_browser_session_stays_on_primary_after_writing(replicated):
+    client = replicated.test_client()
+    # Logging in records the login, which pins the browser session to the primary
+    client.post('/login', data={'username': 'alice', 'password': 'secret1'})
+    assert b'Renamed on primary' in client.get('/dashboard').data
+
+    with client.session_transaction() as session:
+        session.pop('_primary_until')
+    page = client.get('/dashboard').data
+    assert b'Renamed on primary' not in page and b'alice&#39;s Account' in page
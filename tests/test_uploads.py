@@ -0,0 +1,71 @@
+import pytest
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def served(make_app, tmp_path):
+    """An app serving one 1 KiB upload"""
+    (tmp_path / 'uploads').mkdir()
+    (tmp_path / 'uploads' / 'photo.png').write_bytes(CONTENT)
+
+    def serve(**settings):
+        return make_app(UPLOAD_FOLDER=str(tmp_path / 'uploads'), **settings).test_client()
+    return serve
+
+
+def test_upload_is_served_immutable_with_validators(served):
+    response = served().get('/uploads/photo.png')
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.mimetype == 'image/png'
+    assert response.headers['ETag'] and response.headers['Last-Modified']
+    assert response.cache_control.public and response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 60 * 60
+
+
+def test_conditional_requests_get_304(served):
+    client = served()
+    first = client.get('/uploads/photo.png')
+    etag = first.headers['ETag']
+
+    response = client.get('/uploads/photo.png', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.data == b''
+    assert response.headers['ETag'] == etag
+
+    response = client.get('/uploads/photo.png', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 304
+
+    # If-None-Match wins over If-Modified-Since
+    response = client.get('/uploads/photo.png', headers={
+        'If-None-Match': '"stale"', 'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 200 and response.data == CONTENT
+
+
+def test_range_requests(served):
+    client = served()
+    response = client.get('/uploads/photo.png', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+
+    response = client.get('/uploads/photo.png', headers={'Range': 'bytes=-24'})
+    assert response.status_code == 206 and response.data == CONTENT[-24:]
+
+    response = client.get('/uploads/photo.png', headers={'Range': f'bytes={len(CONTENT)}-'})
+    assert response.status_code == 416
+
+
+@pytest.mark.parametrize('filename', ['missing.png', '..%2Fapp0.db', '.'])
+def test_missing_or_outside_files_are_404(served, filename):
+    assert served().get(f'/uploads/{filename}').status_code == 404
+
+
+def test_sendfile_headers_delegate_the_bytes(served, tmp_path):
+    response = served(UPLOAD_SENDFILE_HEADER='X-Accel-Redirect').get('/uploads/photo.png')
+    assert response.headers['X-Accel-Redirect'] == '/protected-uploads/photo.png'
+    assert response.data == b'' and response.mimetype == 'image/png'
+
+    response = served(UPLOAD_SENDFILE_HEADER='X-Sendfile').get('/uploads/photo.png')
+    assert response.headers['X-Sendfile'] == str(tmp_path / 'uploads' / 'photo.png')
+    assert response.headers['ETag']
@@ -0,0 +1,45 @@
+from models import db, User
+from user_cache import user_cache
+
+
+def test_user_cache_is_invalidated_on_commit(make_app, register):
+    app = make_app(USER_CACHE_BACKEND='memory')
+    client = app.test_client()
+    register(client, 'alice')
+    client.get('/dashboard')
+
+    with app.app_context():
+        assert user_cache.backend.get(1)['username'] == 'alice'
+        db.session.get(User, 1).display_name = 'Alice'
+        db.session.rollback()
+        assert user_cache.backend.get(1) is not None
+
+        db.session.get(User, 1).display_name = 'Alice'
+        db.session.commit()
+        assert user_cache.backend.get(1) is None
+
+    client.get('/dashboard')
+    with app.app_context():
+        assert user_cache.backend.get(1)['display_name'] == 'Alice'
+
+
+def test_password_hash_is_not_cached_but_still_loads(make_app, register):
+    app = make_app(USER_CACHE_BACKEND='memory')
+    client = app.test_client()
+    register(client, 'alice')
+    client.get('/dashboard')
+
+    with app.test_request_context():
+        assert 'password_hash' not in user_cache.backend.get(1)
+        user = user_cache.load(1)
+        assert user_cache.stats()['hits'] == 1
+        assert user.check_password('secret1')
+
+
+def test_cache_hits_skip_the_query(make_app, register):
+    app = make_app(USER_CACHE_BACKEND='memory')
+    client = app.test_client()
+    register(client, 'alice')
+    for _ in range(3):
+        assert client.get('/dashboard').status_code == 200
+    assert app.extensions['user_cache'].stats()['hits'] >= 2
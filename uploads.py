@@ -0,0 +1,65 @@
+import mimetypes
+import os
+import stat
+from datetime import datetime, timezone
+from flask import current_app, request, send_file, abort, make_response
+from werkzeug.security import safe_join
+
+
+def _etag(st):
+    """Strong ETag derived from file metadata so it can be computed without opening the file"""
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def send_upload(filename):
+    """Serve an uploaded file with long-lived caching
+
+    Upload filenames are content hashes (or uuid-prefixed for older uploads)
+    and never change, so responses are marked immutable. Conditional requests
+    are answered with 304 from a stat() call alone. The bytes are sent with
+    send_file, which supports Range requests and hands the file to the WSGI
+    server's file_wrapper for zero-copy sendfile, or delegated to the front-end
+    server with UPLOAD_SENDFILE_HEADER.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    path = safe_join(upload_folder, filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except OSError:
+        abort(404)
+    if not stat.S_ISREG(st.st_mode):
+        abort(404)
+
+    etag = _etag(st)
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+    max_age = current_app.config.get('UPLOAD_CACHE_MAX_AGE', 31536000)
+    sendfile_header = current_app.config.get('UPLOAD_SENDFILE_HEADER')
+
+    not_modified = False
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    elif request.if_modified_since:
+        not_modified = last_modified <= request.if_modified_since
+
+    if not_modified:
+        response = make_response('', 304)
+        response.set_etag(etag)
+    elif sendfile_header in ('X-Accel-Redirect', 'X-Sendfile'):
+        response = make_response('')
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        if sendfile_header == 'X-Accel-Redirect':
+            # nginx serves the bytes from an internal location mapped to UPLOAD_FOLDER
+            response.headers['X-Accel-Redirect'] = current_app.config['UPLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + filename
+        else:
+            response.headers['X-Sendfile'] = path
+        response.set_etag(etag)
+    else:
+        response = send_file(path, etag=etag, last_modified=last_modified, max_age=max_age, conditional=True)
+
+    response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,193 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from werkzeug.local import LocalProxy
+from models import db, User
+from database import replica_reads
+
+
+# Never copied into the cache; loaded from the database when accessed
+UNCACHED_FIELDS = ('password_hash',)
+
+
+class MemoryBackend:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        """Values for several keys in order, None for missing ones"""
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def set_many(self, mapping):
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Shared cache for multi-worker deployments (requires the redis package)"""
+
+    def __init__(self, url, ttl=300, prefix='user:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('The redis cache backend requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(f'{self.prefix}{key}')
+        return pickle.loads(value) if value is not None else None
+
+    def get_many(self, keys):
+        """Values for several keys in one MGET round trip, None for missing ones"""
+        if not keys:
+            return []
+        values = self.client.mget([f'{self.prefix}{key}' for key in keys])
+        return [pickle.loads(value) if value is not None else None for value in values]
+
+    def set(self, key, value):
+        self.client.set(f'{self.prefix}{key}', pickle.dumps(value), ex=self.ttl)
+
+    def set_many(self, mapping):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipeline.set(f'{self.prefix}{key}', pickle.dumps(value), ex=self.ttl)
+        pipeline.execute()
+
+    def delete(self, key):
+        self.client.delete(f'{self.prefix}{key}')
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+class UserCache:
+    """Cache of User column values used by the Flask-Login user loader
+
+    Cached users are re-attached to the request session without a query, so
+    views can modify and commit current_user as before. Entries are dropped
+    whenever a User row is updated or deleted and the transaction commits.
+    UNCACHED_FIELDS such as the password hash stay out of the (possibly
+    shared) cache and are loaded from the database on first access.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Configure the backend from USER_CACHE_* settings"""
+        backend = app.config.get('USER_CACHE_BACKEND', 'memory')
+        ttl = app.config.get('USER_CACHE_TTL', 300)
+        if backend == 'memory':
+            self.backend = MemoryBackend(max_size=app.config.get('USER_CACHE_SIZE', 10000), ttl=ttl)
+        elif backend == 'redis':
+            self.backend = RedisBackend(app.config['USER_CACHE_REDIS_URL'], ttl=ttl)
+        elif backend is None or backend == 'null':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown USER_CACHE_BACKEND: {backend}')
+        app.extensions['user_cache'] = self
+
+    def load(self, user_id):
+        """Return the user for an id, from the cache when possible"""
+        if self.backend is None:
+            with replica_reads(db.session()):
+                return db.session.get(User, user_id)
+
+        data = self.backend.get(user_id)
+        if data is not None:
+            self._count('hits')
+            user = User(**data)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        self._count('misses')
+        with replica_reads(db.session()):
+            user = db.session.get(User, user_id)
+        if user is not None:
+            self.backend.set(user_id, {c.key: getattr(user, c.key) for c in User.__table__.columns
+                                       if c.key not in UNCACHED_FIELDS})
+        return user
+
+    def invalidate(self, user_id):
+        """Drop a cached user"""
+        if self.backend is not None:
+            self.backend.delete(user_id)
+
+    def stats(self):
+        """Return hit/miss counters"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+# The instance create_app made for the current app
+user_cache = LocalProxy(lambda: current_app.extensions['user_cache'])
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_user_changed(mapper, connection, target):
+    """Remember changed users so the cache is invalidated on commit"""
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    user_ids = session.info.pop('changed_user_ids', ())
+    cache = current_app.extensions.get('user_cache') if has_app_context() else None
+    if cache is not None:
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_user_ids', None)
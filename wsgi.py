@@ -0,0 +1,11 @@
+"""
+WSGI entry point for pre-fork servers, e.g. `gunicorn --preload wsgi:app`.
+
+The app is created and warmed once in the master process (see app.preload),
+so forked workers start with compiled templates, configured mappers and
+imported modules, and each one opens its own database connections.
+"""
+from app import create_app, preload
+
+app = create_app()
+preload(app)